@@ -0,0 +1,49 @@
+"""Measures /api/* requests/sec with the server's response cache on and off
+
+Each mode runs dist/server.py in its own process against the benchmark
+database and hits it from concurrent clients over HTTP.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import time
+
+from common import ROUTES, fetch, remove_database, start_server, stop_server
+from database_connections import load_rows, seed_database
+
+
+def run_route(url, requests, clients):
+    # One untimed request so the cache, when on, is warm
+    fetch(url)
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        start = time.perf_counter()
+        sizes = list(executor.map(fetch, [url] * requests))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, sum(sizes) / len(sizes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--port', type=int, default=3999)
+    args = parser.parse_args()
+
+    seed_database()
+    load_rows()
+    try:
+        results = {}
+        for cache in [False, True]:
+            server = start_server(args.port, RESPONSE_CACHE='1' if cache else '0')
+            try:
+                for route in ROUTES:
+                    results[(route, cache)] = run_route(
+                        f"http://127.0.0.1:{args.port}{route}", args.requests, args.clients)
+            finally:
+                stop_server(server)
+        for route in ROUTES:
+            (uncached, uncached_size), (cached, cached_size) = results[(
+                route, False)], results[(route, True)]
+            print(f"{route:<44} cache off {uncached:8.1f} req/s {uncached_size / 1024:9.1f} KB   "
+                  f"cache on {cached:8.1f} req/s {cached_size / 1024:9.1f} KB   {cached / uncached:6.1f}x")
+    finally:
+        remove_database()
@@ -0,0 +1,65 @@
+"""Compares building a series' gif from re-read pngs with streaming frames into it
+
+Each mode runs in its own process so peak RSS is measured independently.
+"""
+from os import path
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from chart_rendering import get_series, generate_charts
+
+import imageio
+
+
+def run_mode(mode, days):
+    dates, confirmed, deaths, recovered = get_series(days)
+    with tempfile.TemporaryDirectory() as chart_dir:
+        gif_path = path.join(chart_dir, 'series.gif')
+        start = time.perf_counter()
+        if mode == 'png-reread':
+            # How gifs were built before: write every png, read them all back
+            image_file_paths = [path.join(chart_dir, f"{end}.png")
+                                for end in range(1, days + 1)]
+            generate_charts.render_line_charts(
+                "Benchmark", dates, confirmed, deaths, recovered,
+                [(end, image_file_path, None) for end, image_file_path
+                 in enumerate(image_file_paths, 1)],
+            )
+            imageio.mimsave(gif_path, [imageio.imread(filename)
+                                       for filename in image_file_paths])
+        else:
+            generate_charts.render_line_charts(
+                "Benchmark", dates, confirmed, deaths, recovered,
+                [(end, None, None) for end in range(1, days + 1)],
+                animation_path=gif_path,
+            )
+        elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'seconds': elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--mode', choices=['png-reread', 'streamed'])
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.days[0])
+        sys.exit()
+
+    for days in args.days:
+        for mode in ['png-reread', 'streamed']:
+            result = json.loads(subprocess.run(
+                [sys.executable, __file__, '--mode', mode, '--days', str(days)],
+                check=True, capture_output=True, text=True,
+            ).stdout)
+            print(f"{days:>5} days {mode:<11} {days / result['seconds']:8.2f} frames/sec "
+                  f"{result['peak_rss_mb']:8.1f} MB peak RSS")
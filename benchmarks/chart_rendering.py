@@ -0,0 +1,50 @@
+"""Compares frames/sec of re-plotting every chart from scratch with reusing one figure per series"""
+from os import path
+import argparse
+import datetime
+import logging
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, path.join(pathlib.Path(__file__).parents[1].absolute(), 'data'))
+
+import generate_charts  # noqa: E402
+
+logging.disable(logging.CRITICAL)
+
+
+def get_series(days):
+    start_date = datetime.datetime(2020, 1, 22)
+    dates = [start_date + datetime.timedelta(days=i) for i in range(days)]
+    confirmed = [i * i for i in range(days)]
+    deaths = [i * i // 50 for i in range(days)]
+    recovered = [i * i // 3 for i in range(days)]
+    return dates, confirmed, deaths, recovered
+
+
+def time_frames(label, days, frame_groups):
+    dates, confirmed, deaths, recovered = get_series(days)
+    with tempfile.TemporaryDirectory() as chart_dir:
+        start = time.perf_counter()
+        for frames in frame_groups:
+            generate_charts.render_line_charts(
+                "Benchmark", dates, confirmed, deaths, recovered,
+                [(end, path.join(chart_dir, f"{end}.png"), None) for end in frames],
+            )
+        elapsed = time.perf_counter() - start
+    print(f"{days:>5} days {label:<14} {days / elapsed:8.2f} frames/sec")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, nargs='+', default=[60, 200])
+    args = parser.parse_args()
+    for days in args.days:
+        frames = list(range(1, days + 1))
+        from_scratch = time_frames(
+            'from scratch', days, [[end] for end in frames])
+        reused = time_frames('reused figure', days, [frames])
+        print(f"{days:>5} days {'speedup':<14} {from_scratch / reused:8.2f}x")
@@ -0,0 +1,76 @@
+"""Shared set up for the benchmark scripts"""
+from os import environ, path, remove
+from urllib import request
+import logging
+import pathlib
+import subprocess
+import sys
+import time
+
+BENCHMARK_DB_NAME = 'benchmark_geography'
+environ.setdefault('DB_NAME', BENCHMARK_DB_NAME)
+sys.path.insert(0, path.join(pathlib.Path(__file__).parents[1].absolute(), 'dist'))
+
+from data.load_data import close_connections, create_tables, get_database_path  # noqa: E402
+
+logging.disable(logging.CRITICAL)
+
+SERVER_PATH = path.join(pathlib.Path(__file__).parents[1].absolute(), 'dist', 'server.py')
+ROUTES = [
+    '/api/countries',
+    '/api/boundaries?zoom=2',
+    '/api/cases?country=Country%207&bucket=week',
+    '/api/totals',
+]
+
+
+def remove_database():
+    close_connections()
+    db_path = get_database_path(BENCHMARK_DB_NAME)
+    for suffix in ['', '-wal', '-shm']:
+        if path.exists(db_path + suffix):
+            remove(db_path + suffix)
+
+
+def create_database():
+    remove_database()
+    create_tables(BENCHMARK_DB_NAME)
+
+
+def start_server(port, log=None, **env):
+    """Runs dist/server.py against the benchmark database, with env overrides.
+
+    Its log goes to the log file, if given.
+    """
+    server = subprocess.Popen(
+        [sys.executable, SERVER_PATH],
+        env={
+            **environ,
+            'DB_NAME': BENCHMARK_DB_NAME,
+            'HOST': '127.0.0.1',
+            'PORT': str(port),
+            **env,
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=log or subprocess.DEVNULL,
+    )
+    deadline = time.perf_counter() + 30
+    while True:
+        try:
+            request.urlopen(f"http://127.0.0.1:{port}/api/totals").read()
+            return server
+        except OSError:
+            if time.perf_counter() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError("Server didn't start")
+            time.sleep(0.2)
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
+
+
+def fetch(url):
+    with request.urlopen(request.Request(url, headers={'Accept-Encoding': 'gzip'})) as response:
+        return len(response.read())
@@ -0,0 +1,146 @@
+"""Compares connect-per-call SQLite access with the pooled connection layer
+
+The loader runs in this process. The routes are served by dist/server.py in
+its own process, with SQLITE_POOLING set each way and the response cache
+off, and requested over HTTP from concurrent clients, so every request
+runs on a new server thread as it does in production.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import random
+import tempfile
+import time
+
+from common import (BENCHMARK_DB_NAME, ROUTES, create_database, fetch, remove_database,
+                    start_server, stop_server)
+from data import load_data
+from data.load_data import build_boundary_polygons, close_connections, database, transaction, update_case_rollups
+
+COUNTRIES = 250
+DIVISIONS = 300
+POINTS_PER_COUNTRY = 80
+LOADER_ROWS = 500
+DAYS = 60
+API_REQUESTS = 50
+START_DATE = datetime.date(2020, 1, 22)
+
+
+def seed_database():
+    create_database()
+    countries = [{
+        'name': f"Country {i}",
+        'iso': f"{i:03}",
+        'population': random.randint(1000, 10 ** 9),
+        'center_lat': random.uniform(-90, 90),
+        'center_lng': random.uniform(-180, 180),
+    } for i in range(COUNTRIES)]
+    database('insert', BENCHMARK_DB_NAME, 'country', countries,
+             ['name', 'iso', 'population', 'center_lat', 'center_lng'])
+    divisions = [{'name': f"Division {i}"} for i in range(DIVISIONS)]
+    database('insert', BENCHMARK_DB_NAME, 'division_primary',
+             divisions, ['name'])
+    points = [{
+        'area_name': country['name'],
+        'area_iso': country['iso'],
+        'area_type': 'country',
+        'lat': random.uniform(-90, 90),
+        'lng': random.uniform(-180, 180),
+        'division': i % 3,
+    } for country in countries for i in range(POINTS_PER_COUNTRY)]
+    database('insert', BENCHMARK_DB_NAME, 'boundary_point', points,
+             ['area_name', 'area_iso', 'area_type', 'lat', 'lng', 'division'])
+    build_boundary_polygons(BENCHMARK_DB_NAME)
+    close_connections()
+
+
+def run_loader():
+    if load_data.SQLITE_POOLING:
+        with transaction(BENCHMARK_DB_NAME):
+            load_rows()
+    else:
+        load_rows()
+
+
+def load_rows():
+    # Mirrors load_csse_daily_covid_data: two lookups per row, one insert,
+    # then the rollups for every country written to
+    sql_data = []
+    changed_since = {}
+    for i in range(LOADER_ROWS):
+        country_id = database(
+            'select_one', BENCHMARK_DB_NAME, 'country', None, ['id'],
+            where_field_names=['name'],
+            where_data=[f"Country {i % COUNTRIES}"])[0][0]
+        division_primary_id = database(
+            'select_one', BENCHMARK_DB_NAME, 'division_primary', None,
+            ['id'], where_field_names=['name'],
+            where_data=[f"Division {i % DIVISIONS}"])[0][0]
+        changed_since[country_id] = START_DATE.isoformat()
+        for day in range(DAYS):
+            sql_data.append({
+                'division_primary': division_primary_id,
+                'division_secondary': None,
+                'country': country_id,
+                'date': (START_DATE + datetime.timedelta(days=day)).isoformat(),
+                'count': day,
+            })
+    database('insert', BENCHMARK_DB_NAME, 'covid_confirmed', data=sql_data,
+             field_names=['division_primary', 'division_secondary', 'country', 'date', 'count'])
+    update_case_rollups(BENCHMARK_DB_NAME, changed_since)
+
+
+def time_loader(pooled):
+    load_data.SQLITE_POOLING = pooled
+    close_connections()
+    start = time.perf_counter()
+    run_loader()
+    elapsed = time.perf_counter() - start
+    close_connections()
+    return elapsed
+
+
+def time_routes(pooled, port, requests, clients):
+    """{route: seconds} for the requests, and how many connections the server opened."""
+    with tempfile.TemporaryFile('w+') as log:
+        server = start_server(port, log, SQLITE_POOLING='1' if pooled else '0',
+                              RESPONSE_CACHE='0', LOG_LEVEL='INFO')
+        try:
+            timings = {}
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                for route in ROUTES:
+                    url = f"http://127.0.0.1:{port}{route}"
+                    start = time.perf_counter()
+                    list(executor.map(fetch, [url] * requests))
+                    timings[route] = time.perf_counter() - start
+        finally:
+            stop_server(server)
+        log.seek(0)
+        opened = sum('Opening connection' in line for line in log)
+    return timings, opened
+
+
+def print_result(label, unpooled, pooled):
+    print(f"{label:<50} connect-per-call {unpooled * 1000:9.1f} ms   "
+          f"pooled {pooled * 1000:9.1f} ms   {unpooled / pooled:6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=API_REQUESTS)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--port', type=int, default=3999)
+    args = parser.parse_args()
+
+    load_data.SQLITE_POOLING = False
+    seed_database()
+    try:
+        print_result('loader', time_loader(False), time_loader(True))
+        unpooled, unpooled_opened = time_routes(False, args.port, args.requests, args.clients)
+        pooled, pooled_opened = time_routes(True, args.port, args.requests, args.clients)
+        for route in ROUTES:
+            print_result(f"{route} x{args.requests}", unpooled[route], pooled[route])
+        print(f"{'connections opened by the server':<50} connect-per-call {unpooled_opened:9} "
+              f"     pooled {pooled_opened:9}")
+    finally:
+        remove_database()
@@ -0,0 +1,71 @@
+"""Compares rows/sec and peak RSS of the in-memory and streaming GeoJSON loaders
+
+Each mode runs in its own process so peak RSS is measured independently.
+"""
+from os import path, remove
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from common import BENCHMARK_DB_NAME, create_database, remove_database
+from data.load_data import get_file_path, process_datafile
+from synthetic import write_geojson
+
+GEOJSON_FILE_NAME = 'benchmark_boundary_points.geojson'
+FIELD_NAMES = ['area_name', 'area_iso', 'area_type', 'lat', 'lng', 'division']
+DATA_MAPPING = {
+    'ADMIN': {'field_name': 'area_name', 'process': lambda value: value},
+    'ISO_A2': {'field_name': 'area_iso', 'process': lambda value: value},
+    'ISO_A3': None,
+}
+
+
+def run_mode(mode):
+    create_database()
+    start = time.perf_counter()
+    process_datafile(
+        file_name=GEOJSON_FILE_NAME,
+        data_mapping=DATA_MAPPING,
+        db_name=BENCHMARK_DB_NAME,
+        db_action='insert',
+        field_names=FIELD_NAMES,
+        stream=mode == 'streaming',
+    )
+    elapsed = time.perf_counter() - start
+    remove_database()
+    print(json.dumps({
+        'mode': mode,
+        'seconds': elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--features', type=int, default=250)
+    parser.add_argument('--polygons', type=int, default=4)
+    parser.add_argument('--points', type=int, default=1000)
+    parser.add_argument('--mode', choices=['current', 'streaming'])
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode)
+        sys.exit()
+
+    file_path = get_file_path(GEOJSON_FILE_NAME, 2)
+    write_geojson(file_path, args.features, args.polygons, args.points)
+    rows = args.features * args.polygons * args.points
+    print(f"{rows} points, {path.getsize(file_path) / 2 ** 20:.1f} MB")
+    try:
+        for mode in ['current', 'streaming']:
+            result = json.loads(subprocess.run(
+                [sys.executable, __file__, '--mode', mode],
+                check=True, capture_output=True, text=True,
+            ).stdout)
+            print(f"{mode:<10} {rows / result['seconds']:12.0f} rows/sec "
+                  f"{result['peak_rss_mb']:8.1f} MB peak RSS")
+    finally:
+        remove(file_path)
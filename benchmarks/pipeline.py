@@ -0,0 +1,120 @@
+"""Runs the loader, chart and API stages on synthetic data and reports their metrics
+
+Everything happens in a temporary data directory and the benchmark
+database, so the real downloads and geography database are untouched.
+Pass --output to keep every stage's raw metrics as JSON, and --profile-dir
+to also keep a cProfile dump of each stage.
+"""
+from os import environ, path
+import argparse
+import json
+import pathlib
+import shutil
+import sys
+import tempfile
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--countries', type=int, default=100)
+    parser.add_argument('--provinces', type=int, default=3)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--polygons', type=int, default=4)
+    parser.add_argument('--points', type=int, default=500)
+    parser.add_argument('--api-requests', type=int, default=50)
+    parser.add_argument('--no-charts', dest='charts', action='store_false')
+    parser.add_argument('--output', help="write the raw metrics here as JSON")
+    parser.add_argument('--profile-dir', help="keep cProfile dumps of each stage here")
+    args = parser.parse_args()
+
+    # load_data and generate_charts read these at import, so set them first
+    data_dir = tempfile.mkdtemp(prefix='covid-benchmark-')
+    metrics_file = path.join(data_dir, 'metrics.jsonl')
+    environ['COVID_DATA_DIR'] = data_dir
+    environ['METRICS_FILE'] = metrics_file
+    if args.profile_dir:
+        environ['PROFILE_DIR'] = path.abspath(args.profile_dir)
+
+sys.path.insert(0, path.join(pathlib.Path(__file__).parents[1].absolute(), 'data'))
+
+from common import BENCHMARK_DB_NAME, ROUTES, create_database, remove_database  # noqa: E402
+from data.load_data import database, load_boundary_points, load_csse_daily_covid_data  # noqa: E402
+from data.profiling import stage  # noqa: E402
+from synthetic import write_dataset  # noqa: E402
+import generate_charts  # noqa: E402
+import server  # noqa: E402
+
+
+def seed_geography(places):
+    # The CSSE loader only keeps rows for countries and provinces it knows
+    countries = sorted({country_region for country_region, _ in places})
+    database('insert', BENCHMARK_DB_NAME, 'country', [{
+        'name': country_region,
+        'iso': f"{i:03}",
+    } for i, country_region in enumerate(countries)], ['name', 'iso'])
+    database('insert', BENCHMARK_DB_NAME, 'division_primary', [
+        {'name': province_state} for _, province_state in places if province_state
+    ], ['name'])
+
+
+def run_charts():
+    cube = generate_charts.get_daily_cube()
+    chart_cache = generate_charts.load_chart_cache()
+    generate_charts.run_chart_jobs(
+        generate_charts.get_world_chart_jobs(cube, chart_cache, generate_gif=False),
+        chart_cache,
+    )
+
+
+def run_api(requests):
+    client = server.app.test_client()
+    for route in ROUTES:
+        for _ in range(requests):
+            assert client.get(route).status_code == 200
+
+
+def summarize(metrics):
+    stages = {}
+    for metric in metrics:
+        summary = stages.setdefault(metric['stage'], {
+            'calls': 0, 'seconds': 0, 'rows': None, 'peak_rss_mb': None})
+        summary['calls'] += 1
+        summary['seconds'] += metric['seconds']
+        if metric.get('rows') is not None:
+            summary['rows'] = (summary['rows'] or 0) + metric['rows']
+        if metric.get('peak_rss_mb') is not None:
+            summary['peak_rss_mb'] = max(summary['peak_rss_mb'] or 0, metric['peak_rss_mb'])
+    print(f"{'stage':<44} {'calls':>6} {'seconds':>9} {'rows':>10} {'rows/sec':>11} {'peak RSS MB':>12}")
+    for name, summary in stages.items():
+        rows = summary['rows']
+        rows_per_sec = rows / summary['seconds'] if rows is not None and summary['seconds'] else None
+        print(f"{name:<44} {summary['calls']:>6} {summary['seconds']:>9.3f} "
+              f"{'' if rows is None else rows:>10} "
+              f"{'' if rows_per_sec is None else f'{rows_per_sec:.0f}':>11} "
+              f"{'' if summary['peak_rss_mb'] is None else summary['peak_rss_mb']:>12}")
+
+
+if __name__ == "__main__":
+    try:
+        with stage('benchmarks.write_dataset', countries=args.countries, provinces=args.provinces,
+                   days=args.days, polygons=args.polygons, points=args.points):
+            places = write_dataset(data_dir, args.countries, args.provinces,
+                                   args.days, args.polygons, args.points)
+        create_database()
+        seed_geography(places)
+        load_boundary_points(BENCHMARK_DB_NAME)
+        load_csse_daily_covid_data(db_name=BENCHMARK_DB_NAME)
+        # Nothing changed, so this one should write nothing
+        load_csse_daily_covid_data(db_name=BENCHMARK_DB_NAME)
+        if args.charts:
+            run_charts()
+        run_api(args.api_requests)
+
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            metrics = [json.loads(line) for line in f]
+        summarize(metrics)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'args': vars(args), 'metrics': metrics}, f, indent=2)
+    finally:
+        remove_database()
+        shutil.rmtree(data_dir)
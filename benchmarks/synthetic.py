@@ -0,0 +1,122 @@
+"""Writes synthetic CSSE reports and boundary GeoJSON shaped like the real downloads
+
+Scale with --countries, --provinces (per country, 0 for country level rows
+only), --days, --polygons and --points (per country boundary).
+"""
+from os import makedirs, path
+import argparse
+import datetime
+import json
+import random
+
+# retrieve_data.py downloads from here onwards, and generate_charts.py reads from here
+START_DATE = datetime.date(2020, 1, 22)
+DAILY_FIELD_NAMES = ['Province/State', 'Country/Region', 'Last Update',
+                     'Confirmed', 'Deaths', 'Recovered', 'Latitude', 'Longitude']
+
+
+def get_places(countries, provinces):
+    """[(country_region, province_state), ...], province_state '' for whole countries"""
+    places = []
+    for i in range(countries):
+        if provinces:
+            places += [(f"Country {i}", f"Province {i}-{j}") for j in range(provinces)]
+        else:
+            places.append((f"Country {i}", ''))
+    return places
+
+
+def get_series(places, days, seed=0):
+    """Cumulative {place: [(confirmed, deaths, recovered), ...]} for every day"""
+    generator = random.Random(seed)
+    series = {}
+    for place in places:
+        confirmed = deaths = recovered = 0
+        growth = generator.uniform(0.02, 0.2)
+        days_series = []
+        for _ in range(days):
+            confirmed += int(confirmed * growth * generator.random()) + generator.randint(0, 3)
+            deaths = max(deaths, int(confirmed * generator.uniform(0.005, 0.03)))
+            recovered = max(recovered, int(confirmed * generator.uniform(0.2, 0.6)))
+            days_series.append((confirmed, deaths, recovered))
+        series[place] = days_series
+    return series
+
+
+def write_csv_line(f, values):
+    f.write(",".join(f'"{value}"' if ',' in str(value) else str(value)
+                     for value in values) + '\n')
+
+
+def write_daily_reports(data_dir, series, days):
+    for day in range(days):
+        date = START_DATE + datetime.timedelta(days=day)
+        file_path = path.join(data_dir, f"csse_daily_{date:%m-%d-%Y}.csv")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            write_csv_line(f, DAILY_FIELD_NAMES)
+            for (country_region, province_state), days_series in series.items():
+                write_csv_line(f, [province_state, country_region, f"{date}T12:00:00",
+                                   *days_series[day], 0.0, 0.0])
+
+
+def write_time_series(data_dir, series, days):
+    """covid_confirmed.csv, as load_data.load_csse_daily_covid_data reads it"""
+    dates = [START_DATE + datetime.timedelta(days=day) for day in range(days)]
+    with open(path.join(data_dir, 'covid_confirmed.csv'), 'w', encoding='utf-8') as f:
+        write_csv_line(f, ['Province/State', 'Country/Region', 'Lat', 'Long'] +
+                       [f"{date.month}/{date.day}/{date:%y}" for date in dates])
+        for (country_region, province_state), days_series in series.items():
+            write_csv_line(f, [province_state, country_region, 0.0, 0.0] +
+                           [confirmed for confirmed, _, _ in days_series])
+
+
+def write_geojson(file_path, features, polygons, points):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        for i in range(features):
+            feature = {
+                'type': 'Feature',
+                'properties': {
+                    'ADMIN': f"Country {i}",
+                    'ISO_A2': f"{i:03}",
+                    'ISO_A3': f"C{i:03}",
+                },
+                'geometry': {
+                    'type': 'MultiPolygon',
+                    'coordinates': [[[
+                        [random.uniform(-180, 180), random.uniform(-90, 90)]
+                        for _ in range(points)
+                    ]] for _ in range(polygons)],
+                },
+            }
+            f.write(('' if i == 0 else ',\n') + json.dumps(feature))
+        f.write('\n]}\n')
+
+
+def write_dataset(data_dir, countries, provinces, days, polygons, points):
+    """Writes every file the loader and charts read into data_dir.
+
+    Returns the places written, so callers can seed the geography tables.
+    """
+    makedirs(data_dir, exist_ok=True)
+    places = get_places(countries, provinces)
+    series = get_series(places, days)
+    write_daily_reports(data_dir, series, days)
+    write_time_series(data_dir, series, days)
+    write_geojson(path.join(data_dir, 'country_boundary_points.geojson'),
+                  countries, polygons, points)
+    return places
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('output_dir')
+    parser.add_argument('--countries', type=int, default=200)
+    parser.add_argument('--provinces', type=int, default=5)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--polygons', type=int, default=4)
+    parser.add_argument('--points', type=int, default=1000)
+    args = parser.parse_args()
+    places = write_dataset(args.output_dir, args.countries, args.provinces,
+                           args.days, args.polygons, args.points)
+    print(f"{len(places)} places over {args.days} days written to {args.output_dir}")
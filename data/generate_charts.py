@@ -1,25 +1,66 @@
 """Creates graphs from COVID-19 data"""
-from collections import OrderedDict
-from os import path
-from pprint import pformat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import environ, getpid, listdir, path, remove, replace
+import argparse
 import csv
 import datetime
+import hashlib
+import json
 import logging
 import pathlib
+import signal
+import sys
 import imageio
-from matplotlib import pyplot as plt
+import matplotlib
+import numpy
 
+matplotlib.use('Agg')  # Charts are only ever saved, never shown
+from matplotlib import pyplot as plt  # noqa: E402
 
-logging.basicConfig(level=logging.INFO)
+sys.path.insert(0, path.join(pathlib.Path(__file__).parents[1].absolute(), 'dist', 'data'))
+from profiling import stage  # noqa: E402
+
+logging.basicConfig(level=environ.get('LOG_LEVEL', 'INFO'))
 logger = logging.getLogger(__name__)
 
+METRICS = ['Confirmed', 'Deaths', 'Recovered']
+# Charts rendered by one job on one reused figure
+CHART_FRAMES_PER_JOB = 50
+# Bump when chart styling changes so every chart is drawn again
+CHART_STYLE_VERSION = 1
+CHART_MANIFEST = '.manifest.json'
+# imageio writers that append frames to the file as they arrive
+ANIMATION_WRITER_ARGS = {
+    'gif': {'format': 'GIF-PIL'},
+    'mp4': {'format': 'FFMPEG'},
+}
+# Countries the database keeps apart but the charts draw as one
+CHART_COUNTRY_MERGES = {
+    '': 'Unknown',
+    'Congo DRC': 'Congo',
+}
+
 
 def get_file_path(file_name):
-    return path.join(pathlib.Path(__file__).parents[0].absolute(), file_name)
+    # COVID_DATA_DIR points the charts at another copy of the data, as load_data does
+    data_dir = environ.get('COVID_DATA_DIR') or pathlib.Path(__file__).parents[0].absolute()
+    return path.join(data_dir, file_name)
+
 
+def get_country_aliases():
+    # The loader's CSSE aliases, with CHART_COUNTRY_MERGES applied on top
+    aliases_path = path.join(pathlib.Path(__file__).parents[1].absolute(),
+                             'dist', 'data', 'country_aliases.csv')
+    with open(aliases_path, 'r', encoding='utf-8') as aliases_file:
+        aliases = {row['alias']: row['name'] for row in csv.DictReader(aliases_file)}
+    aliases = {alias: CHART_COUNTRY_MERGES.get(name, name) for alias, name in aliases.items()}
+    aliases.update(CHART_COUNTRY_MERGES)
+    return aliases
 
-def get_daily_data():
-    new_daily_data = {}
+
+def iter_daily_rows():
+    """Yields (date, country_region, province_state, row) for every csse_daily_*.csv row."""
+    country_aliases = get_country_aliases()
     start_date = datetime.date(2020, 1, 22)
     current_date = datetime.date.today()
     target_date = start_date
@@ -33,112 +74,167 @@ def get_daily_data():
                 reader = csv.DictReader(datafile, fieldnames=fieldnames)
                 next(reader)  # skip headers
                 for row in reader:
-                    target_data = {key: value for key, value in row.items()}
-                    country_region = target_data['Country/Region'].strip(' *')
-                    province_state = target_data['Province/State'].strip(' *')
+                    country_region = row['Country/Region'].strip(' *')
+                    province_state = row['Province/State'].strip(' *')
 
                     # Some of this data needs to be helped along
-                    if country_region == "Viet Nam":
-                        country_region = "Vietnam"
-                    elif country_region == "Republic of the Congo" or country_region == "Congo (Brazzaville)" or country_region == "Congo (Kinshasa)":
-                        country_region = "Congo"
-                    elif country_region == "Czech Republic":
-                        country_region = "Czechia"
-                    elif country_region == "Hong Kong SAR":
-                        country_region = "Hong Kong"
-                    elif country_region == "Iran (Islamic Republic of)":
-                        country_region = "Iran"
-                    elif country_region == "Macao SAR":
-                        country_region = "Macau"
-                    elif country_region == "Mainland China":
-                        country_region = "China"
-                    elif country_region == "Republic of Moldova":
-                        country_region = "Moldova"
-                    elif country_region == "Republic of Ireland":
-                        country_region = "Ireland"
-                    elif country_region == "Korea, South" or country_region == "Republic of Korea":
-                        country_region = "South Korea"
-                    elif country_region == "Russian Federation":
-                        country_region = "Russia"
-                    elif country_region == "Gambia, The":
-                        country_region = "The Gambia"
-                    elif country_region == "UK":
-                        country_region = "United Kingdom"
-                    elif country_region == "Holy See":
-                        country_region = "Vatican City"
-                    elif country_region == "":
-                        country_region = "Unknown"
-
-                    if country_region is not None and country_region != '':
-                        try:
-                            new_daily_data[country_region]
-                        except KeyError:
-                            new_daily_data[country_region] = {}
-
+                    country_region = country_aliases.get(
+                        country_region, country_region)
                     if province_state is None or province_state == '':
                         province_state = "Entire"
 
-                    try:
-                        new_daily_data[country_region][province_state]
-                    except KeyError:
-                        new_daily_data[country_region][province_state] = OrderedDict(
-                        )
-
-                    if province_state is not None and province_state != '':
-                        new_daily_data[country_region][province_state][formatted_target_date] = target_data
-                    elif country_region is not None and country_region != '':
-                        new_daily_data[country_region][formatted_target_date] = target_data
-                    else:
-                        logger.warning("Data has no location")
-                        new_daily_data[formatted_target_date] = target_data
+                    yield target_date, country_region, province_state, row
 
         except FileNotFoundError:
-            logger.warning("{formatted_target_date} file not read")
+            logger.warning(f"{formatted_target_date} file not read")
         target_date += datetime.timedelta(days=1)
-    return new_daily_data
-
 
-def create_daily_data_line_chart_for_one_country(country_region, record, generate_gif=True):
-    logger.debug(pformat(record))
-    logger.info(f"'{country_region}'")
-    logger.debug(type(record))
-    for province_state, daily_data in record.items():
-        logger.info(f"'{province_state}'")
-        image_file_paths = []
-        dates = [
-            datetime.datetime.strptime(key, "%m-%d-%Y") for key in daily_data.keys()
-        ]
 
-        confirmed = []
-        deaths = []
-        recovered = []
-        for data in daily_data.values():
-            confirmed.append(get_int_value(data['Confirmed']))
-            deaths.append(get_int_value(data['Deaths']))
-            recovered.append(get_int_value(data['Recovered']))
-
-        for i in range(len(dates)):
-            loop_dates = dates[:i+1]
-            date_string = max(loop_dates).strftime("%m-%d-%Y")
-            save_file_path = get_file_path(
-                path.join(
-                    'charts',
-                    f"{country_region}-{province_state}-{date_string}.png"
-                )
-            )
-            image_file_paths.append(save_file_path)
-            if path.exists(save_file_path):
-                logger.warning(f"{save_file_path} already exists")
-                continue
+def get_daily_cube():
+    """Loads every daily report into a dense (location x date x metric) array.
+
+    Returns a dict of:
+      locations: [(country_region, province_state), ...]
+      location_index: {(country_region, province_state): position}
+      dates: [datetime, ...] for every day that has a report
+      date_index: {date: position}
+      values: int64 array of METRICS counts, shape (locations, dates, metrics)
+      reported: bool array, shape (locations, dates), True where a location
+        appears in that day's report
+    and rollups summed once here so totals are lookups rather than scans:
+      countries: sorted country_region names
+      country_index: {country_region: position}
+      country_locations: {country_region: [location position, ...]}
+      country_values, country_reported: as values and reported, per country
+      world_values, world_reported: as values and reported, for every location
+    """
+    location_index = {}
+    date_index = {}
+    cells = {}
+    with stage('generate_charts.read_daily_reports') as metrics:
+        metrics['rows'] = 0
+        for date, country_region, province_state, row in iter_daily_rows():
+            location = location_index.setdefault(
+                (country_region, province_state), len(location_index))
+            day = date_index.setdefault(date, len(date_index))
+            # Later rows for the same place and day replace earlier ones
+            cells[(location, day)] = [
+                get_int_value(row[metric], country_region, province_state) for metric in METRICS
+            ]
+            metrics['rows'] += 1
+
+    values = numpy.zeros(
+        (len(location_index), len(date_index), len(METRICS)), dtype=numpy.int64)
+    reported = numpy.zeros(
+        (len(location_index), len(date_index)), dtype=bool)
+    if cells:
+        positions = numpy.array(list(cells.keys()), dtype=numpy.intp)
+        values[positions[:, 0], positions[:, 1]] = list(cells.values())
+        reported[positions[:, 0], positions[:, 1]] = True
+
+    countries = sorted({country_region for country_region, _ in location_index})
+    country_index = {country_region: position for position,
+                     country_region in enumerate(countries)}
+    country_locations = {country_region: [] for country_region in countries}
+    for (country_region, _), location in location_index.items():
+        country_locations[country_region].append(location)
+    location_countries = numpy.array(
+        [country_index[country_region] for country_region, _ in location_index], dtype=numpy.intp)
+    country_values = numpy.zeros(
+        (len(countries), len(date_index), len(METRICS)), dtype=numpy.int64)
+    country_reported = numpy.zeros(
+        (len(countries), len(date_index)), dtype=bool)
+    numpy.add.at(country_values, location_countries, values)
+    numpy.logical_or.at(country_reported, location_countries, reported)
+
+    return {
+        'locations': list(location_index.keys()),
+        'location_index': location_index,
+        'dates': [datetime.datetime.combine(date, datetime.time()) for date in date_index.keys()],
+        'date_index': date_index,
+        'values': values,
+        'reported': reported,
+        'countries': countries,
+        'country_index': country_index,
+        'country_locations': country_locations,
+        'country_values': country_values,
+        'country_reported': country_reported,
+        'world_values': country_values.sum(axis=0),
+        'world_reported': country_reported.any(axis=0),
+    }
 
-            _, ax = plt.subplots()
-            plt.plot(loop_dates, confirmed[:i+1],
-                     color='orange', label="Confirmed")
-            plt.plot(loop_dates, deaths[:i+1], color='red', label="Deaths")
-            plt.plot(loop_dates, recovered[:i+1],
-                     color='green', label="Recovered")
 
-            ticks_divisor = 5
+def get_country_locations(cube, country_region):
+    return cube['country_locations'].get(country_region, [])
+
+
+def get_totals(cube, country_region=None):
+    """METRICS totals for the whole world, or one country_region, per date.
+
+    Returns (dates, values) where values has shape (dates, metrics) and only
+    dates with at least one report are included.
+    """
+    if country_region is None:
+        values, reported = cube['world_values'], cube['world_reported']
+    else:
+        country = cube['country_index'][country_region]
+        values = cube['country_values'][country]
+        reported = cube['country_reported'][country]
+    totals = values[reported]
+    dates = [date for date, is_reported in zip(
+        cube['dates'], reported) if is_reported]
+    return dates, totals
+
+
+def render_line_charts(title_prefix, dates, confirmed, deaths, recovered, frames, animation_path=None):
+    """Renders a series' charts for each of frames, reusing one figure.
+
+    frames is [(number of days shown, save_file_path or None,
+    cached_file_path or None), ...] in ascending order. Each frame only
+    updates the line data, axis limits and title, is drawn once to an RGB
+    buffer, saved as a png if it has a save_file_path, and streamed straight
+    into animation_path if one is given. Frames that only feed the animation
+    and already have an up to date png are read from it instead of drawn.
+    Returns the number of frames handled.
+    """
+    ticks_divisor = 5
+    first_end = frames[0][0]
+    fig, ax = plt.subplots()
+    lines = [
+        ax.plot(dates[:first_end], series[:first_end],
+                color=color, label=label)[0]
+        for series, color, label in [
+            (confirmed, 'orange', "Confirmed"),
+            (deaths, 'red', "Deaths"),
+            (recovered, 'green', "Recovered"),
+        ]
+    ]
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number')
+    ax.legend(
+        loc='upper center',
+        bbox_to_anchor=(0.5, -0.05),
+        shadow=True,
+        ncol=3,
+    )
+
+    writer = None
+    temp_animation_path = None
+    try:
+        if animation_path is not None:
+            animation_format = animation_path.rsplit('.', 1)[-1]
+            temp_animation_path = f"{animation_path}.{getpid()}.tmp.{animation_format}"
+            writer = imageio.get_writer(
+                temp_animation_path, mode='I', **ANIMATION_WRITER_ARGS[animation_format])
+        for end, save_file_path, cached_file_path in frames:
+            if save_file_path is None and cached_file_path is not None and writer is not None:
+                writer.append_data(imageio.imread(cached_file_path)[:, :, :3])
+                continue
+            loop_dates = dates[:end]
+            for line, series in zip(lines, [confirmed, deaths, recovered]):
+                line.set_data(loop_dates, series[:end])
+            ax.relim()
+            ax.autoscale_view()
             if len(loop_dates) > ticks_divisor:
                 ax.xaxis.set_major_locator(
                     plt.MaxNLocator(
@@ -147,34 +243,254 @@ def create_daily_data_line_chart_for_one_country(country_region, record, generat
                         )
                     )
                 )
+            date_string = loop_dates[-1].strftime("%m-%d-%Y")
+            title = f"{title_prefix} daily COVID-19 status upto {date_string}"
+            ax.set_title(title)
+
+            fig.canvas.draw()
+            frame = numpy.asarray(fig.canvas.buffer_rgba())
+            if save_file_path is not None:
+                logger.debug(f"Saving chart for {title} to {save_file_path}")
+                save_frame(frame, save_file_path)
+            if writer is not None:
+                writer.append_data(frame[:, :, :3])
+
+        if writer is not None:
+            writer.close()
+            writer = None
+            logger.info(f"Saving animation to {animation_path}")
+            replace(temp_animation_path, animation_path)
+    finally:
+        plt.close(fig)
+        if writer is not None:
+            writer.close()
+        if temp_animation_path is not None and path.exists(temp_animation_path):
+            remove(temp_animation_path)
+    return len(frames)
+
+
+def save_frame(frame, save_file_path):
+    # Write then rename so an aborted run never leaves a partial chart behind
+    temp_file_path = f"{save_file_path}.{getpid()}.tmp.png"
+    try:
+        imageio.imwrite(temp_file_path, frame)
+        replace(temp_file_path, save_file_path)
+    finally:
+        if path.exists(temp_file_path):
+            remove(temp_file_path)
+
+
+def load_chart_cache():
+    """Reads the chart manifest: {file name: hash of the inputs it was drawn from}.
+
+    Also lists the charts directory once, so planning never stats each chart.
+    """
+    charts_path = get_file_path('charts')
+    pathlib.Path(charts_path).mkdir(parents=True, exist_ok=True)
+    try:
+        with open(path.join(charts_path, CHART_MANIFEST), 'r') as manifest_file:
+            manifest = json.load(manifest_file)['files']
+    except (FileNotFoundError, ValueError, KeyError):
+        manifest = {}
+    return {
+        'manifest': manifest,
+        'existing': set(listdir(charts_path)),
+        'live': set(),
+    }
 
-            plt.xlabel('Date')
-            plt.ylabel('Number')
-            title = f"{country_region}-{province_state} daily COVID-19 status upto {date_string}"
-            plt.title(title)
-            ax.legend(
-                loc='upper center',
-                bbox_to_anchor=(0.5, -0.05),
-                shadow=True,
-                ncol=3,
-            )
-            # plt.show()
-            logger.info(f"Saving chart for {title} to {save_file_path}")
-            plt.savefig(save_file_path)
-            plt.close()
-
-        if generate_gif:
-            gif_path = get_file_path(
-                path.join(
-                    'charts', f"{country_region}-{province_state}-{date_string}.gif")
-            )
-            if not path.exists(gif_path):
-                imageio.mimsave(
-                    gif_path,
-                    [
-                        imageio.imread(filename) for filename in image_file_paths
-                    ]
-                )
+
+def save_chart_cache(chart_cache):
+    manifest_path = get_file_path(path.join('charts', CHART_MANIFEST))
+    temp_file_path = f"{manifest_path}.{getpid()}.tmp"
+    with open(temp_file_path, 'w') as manifest_file:
+        json.dump({'files': chart_cache['manifest']},
+                  manifest_file, indent=0, sort_keys=True)
+    replace(temp_file_path, manifest_path)
+
+
+def is_chart_cached(chart_cache, file_name, digest):
+    chart_cache['live'].add(file_name)
+    return (
+        chart_cache['manifest'].get(file_name) == digest and
+        file_name in chart_cache['existing']
+    )
+
+
+def collect_chart_garbage(chart_cache, extensions):
+    """Deletes charts with one of extensions that this run didn't ask for."""
+    for file_name in sorted(chart_cache['existing'] - chart_cache['live']):
+        if file_name.rsplit('.', 1)[-1] in extensions or '.tmp.' in file_name:
+            logger.info(f"Removing stale chart {file_name}")
+            remove(get_file_path(path.join('charts', file_name)))
+            chart_cache['manifest'].pop(file_name, None)
+    for file_name in list(chart_cache['manifest']):
+        if file_name not in chart_cache['live'] and file_name.rsplit('.', 1)[-1] in extensions:
+            del chart_cache['manifest'][file_name]
+
+
+def get_line_chart_jobs(file_prefix, title_prefix, dates, values, chart_cache, generate_gif=True, animation_format='gif', write_png=True):
+    """Lists the renders one series still needs.
+
+    Every chart is keyed on a hash of the series up to its day plus the chart
+    style, so only charts whose inputs changed since they were drawn (or that
+    are missing) are rendered again.
+
+    Returns [{'args': render_line_charts arguments, 'outputs': {file name:
+    hash}}, ...]. The animation keeps one name as days are added, and one job
+    streams every frame into it whenever it is out of date, reading frames
+    that already have an up to date png. Missing pngs not covered by that
+    job are split into jobs of up to CHART_FRAMES_PER_JOB frames. Each job carries the series up to its last
+    frame.
+    """
+    frames = []
+    outputs = {}
+    confirmed, deaths, recovered = values.T.tolist()
+    hasher = hashlib.sha1(
+        f"{CHART_STYLE_VERSION}|{title_prefix}|".encode('utf-8'))
+    for i in range(len(dates)):
+        date_string = dates[i].strftime("%m-%d-%Y")
+        hasher.update(
+            f"{date_string},{confirmed[i]},{deaths[i]},{recovered[i]};".encode('utf-8'))
+        digest = hasher.hexdigest()
+        file_name = f"{file_prefix}-{date_string}.png"
+        save_file_path = get_file_path(path.join('charts', file_name))
+        if not write_png:
+            frames.append((i + 1, None, None))
+        elif is_chart_cached(chart_cache, file_name, digest):
+            frames.append((i + 1, None, save_file_path))
+        else:
+            frames.append((i + 1, save_file_path, None))
+            outputs[file_name] = digest
+
+    animation_path = None
+    if generate_gif and frames:
+        file_name = f"{file_prefix}.{animation_format}"
+        if not is_chart_cached(chart_cache, file_name, digest):
+            animation_path = get_file_path(path.join('charts', file_name))
+            outputs[file_name] = digest
+
+    # Pngs the animation job doesn't draw on the way
+    png_frames = [] if animation_path is not None else [
+        frame for frame in frames if frame[1] is not None]
+    frame_groups = [
+        (png_frames[start:start + CHART_FRAMES_PER_JOB], None)
+        for start in range(0, len(png_frames), CHART_FRAMES_PER_JOB)
+    ]
+    if animation_path is not None:
+        frame_groups.append((frames, animation_path))
+
+    chart_jobs = []
+    for job_frames, job_animation_path in frame_groups:
+        end = job_frames[-1][0]
+        job_outputs = {
+            path.basename(save_file_path): outputs[path.basename(save_file_path)]
+            for _, save_file_path, _ in job_frames if save_file_path is not None
+        }
+        if job_animation_path is not None:
+            job_outputs[path.basename(job_animation_path)] = outputs[path.basename(
+                job_animation_path)]
+        chart_jobs.append({
+            'args': (
+                title_prefix, dates[:end],
+                confirmed[:end], deaths[:end], recovered[:end],
+                job_frames, job_animation_path,
+            ),
+            'outputs': job_outputs,
+        })
+    return chart_jobs
+
+
+def ignore_interrupts():
+    # Workers finish their current chart; the parent handles Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_chart_jobs(chart_jobs, chart_cache, jobs=1):
+    """Renders every chart job, spread over a pool of worker processes if jobs > 1.
+
+    The manifest in chart_cache is updated as each job finishes.
+    """
+    with stage('generate_charts.run_chart_jobs', jobs=jobs) as metrics:
+        metrics['rows'] = _run_chart_jobs(chart_jobs, chart_cache, jobs)
+
+
+def _run_chart_jobs(chart_jobs, chart_cache, jobs):
+    total = sum(len(job['args'][5]) for job in chart_jobs)
+    if total == 0:
+        return 0
+    report_every = max(1, total // 20)
+    logger.info(f"Rendering {total} frames with {jobs} job(s)")
+    rendered = 0
+    if jobs <= 1:
+        for job in chart_jobs:
+            previous, rendered = rendered, rendered + \
+                render_line_charts(*job['args'])
+            chart_cache['manifest'].update(job['outputs'])
+            if previous // report_every != rendered // report_every or rendered == total:
+                logger.info(f"{rendered}/{total} frames rendered")
+        return rendered
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=ignore_interrupts) as executor:
+        futures = {executor.submit(render_line_charts, *job['args']): job
+                   for job in chart_jobs}
+        try:
+            for future in as_completed(futures):
+                previous, rendered = rendered, rendered + future.result()
+                chart_cache['manifest'].update(futures[future]['outputs'])
+                if previous // report_every != rendered // report_every or rendered == total:
+                    logger.info(f"{rendered}/{total} frames rendered")
+        except BaseException:
+            logger.warning("Aborting, cancelling charts not yet started")
+            for future in futures:
+                future.cancel()
+            raise
+    return rendered
+
+
+def create_line_charts(file_prefix, title_prefix, dates, values, generate_gif=True, jobs=1, **job_options):
+    chart_cache = load_chart_cache()
+    try:
+        run_chart_jobs(
+            get_line_chart_jobs(file_prefix, title_prefix, dates,
+                                values, chart_cache, generate_gif, **job_options),
+            chart_cache,
+            jobs=jobs,
+        )
+    finally:
+        save_chart_cache(chart_cache)
+
+
+def get_country_chart_jobs(cube, country_region, chart_cache, generate_gif=True, **job_options):
+    chart_jobs = []
+    for location in get_country_locations(cube, country_region):
+        province_state = cube['locations'][location][1]
+        reported = cube['reported'][location]
+        dates = [date for date, is_reported in zip(
+            cube['dates'], reported) if is_reported]
+        chart_jobs += get_line_chart_jobs(
+            f"{country_region}-{province_state}",
+            f"{country_region}-{province_state}",
+            dates,
+            cube['values'][location][reported],
+            chart_cache,
+            generate_gif,
+            **job_options,
+        )
+    return chart_jobs
+
+
+def create_daily_data_line_chart_for_one_country(cube, country_region, generate_gif=True, jobs=1, **job_options):
+    logger.info(f"'{country_region}'")
+    chart_cache = load_chart_cache()
+    try:
+        run_chart_jobs(
+            get_country_chart_jobs(cube, country_region,
+                                   chart_cache, generate_gif, **job_options),
+            chart_cache,
+            jobs=jobs,
+        )
+    finally:
+        save_chart_cache(chart_cache)
 
 
 def get_int_value(input, country_region='unknown', province_state='unknown'):
@@ -187,144 +503,69 @@ def get_int_value(input, country_region='unknown', province_state='unknown'):
     return int_val
 
 
-def create_world_chart(data, generate_gif=True):
-
-    # Add data groups by date
-    confirmed = OrderedDict()
-    recovered = OrderedDict()
-    deaths = OrderedDict()
-    dates = []
-    cumulative_confirmed = 0
-    cumulative_recovered = 0
-    cumulative_deaths = 0
-    image_file_paths = []
-    for country_region, country_report in data.items():
-        logger.info(country_region)
-        logger.debug(country_report)
-        for province_state, province_state_report in country_report.items():
-            logger.debug(province_state)
-            logger.debug(province_state_report)
-            for date_string, daily_data in province_state_report.items():
-                logger.debug(date_string)
-                logger.debug(daily_data)
-
-                province_state_confirmed = get_int_value(
-                    daily_data['Confirmed'])
-                province_state_recovered = get_int_value(
-                    daily_data['Recovered'])
-                province_state_deaths = get_int_value(daily_data['Deaths'])
-
-                try:
-                    confirmed[date_string] += province_state_confirmed
-                    recovered[date_string] += province_state_recovered
-                    deaths[date_string] += province_state_deaths
-                except KeyError:
-                    confirmed[date_string] = province_state_confirmed
-                    recovered[date_string] = province_state_recovered
-                    deaths[date_string] = province_state_deaths
-                    dates.append(date_string)
-
-                cumulative_confirmed += province_state_confirmed
-                cumulative_recovered += province_state_recovered
-                cumulative_deaths += province_state_deaths
-
-    global_data = {
-        'confirmed': confirmed,
-        'recovered': recovered,
-        'deaths': deaths,
-        'cumulative_confirmed': cumulative_confirmed,
-        'cumulative_recovered': cumulative_recovered,
-        'cumulative_deaths': cumulative_deaths,
-    }
-    logger.info(global_data)
-
-    # Generate chart(s)
-    date_dates = sorted([datetime.datetime.strptime(
-        date_string, "%m-%d-%Y") for date_string in set(dates)])
-    for i in range(len(date_dates)):
-        loop_dates = date_dates[:i+1]
-        logger.debug(loop_dates)
-        date_string = max(loop_dates).strftime("%m-%d-%Y")
-
-        save_file_path = get_file_path(
-            path.join(
-                'charts',
-                f"Entire-Planet-{date_string}.png"
-            )
-        )
-        image_file_paths.append(save_file_path)
-        if path.exists(save_file_path):
-            logger.warning(f"{save_file_path} already exists")
-            continue
-
-        _, ax = plt.subplots()
-
-        logger.info(f"{len(loop_dates)} days of data")
-        confirmed_values = [
-            confirmed[date.strftime("%m-%d-%Y")] for date in loop_dates]
-        deaths_values = [deaths[date.strftime(
-            "%m-%d-%Y")] for date in loop_dates]
-        recovered_values = [
-            recovered[date.strftime("%m-%d-%Y")] for date in loop_dates]
-        logger.debug(confirmed_values)
-        logger.debug(deaths_values)
-        logger.debug(recovered_values)
-
-        plt.plot(
-            loop_dates, confirmed_values,
-            color='orange', label="Confirmed"
-        )
-        plt.plot(
-            loop_dates, deaths_values,
-            color='red', label="Deaths"
-        )
-        plt.plot(
-            loop_dates, recovered_values,
-            color='green', label="Recovered"
-        )
+def get_world_chart_jobs(cube, chart_cache, generate_gif=True, **job_options):
+    dates, totals = get_totals(cube)
+    cumulative = totals.sum(axis=0)
+    logger.info({
+        f"cumulative_{metric.lower()}": int(cumulative[i]) for i, metric in enumerate(METRICS)
+    })
+    return get_line_chart_jobs("Entire-Planet", "Entire Planet",
+                               dates, totals, chart_cache, generate_gif, **job_options)
 
-        ticks_divisor = 5
-        if len(loop_dates) > ticks_divisor:
-            ax.xaxis.set_major_locator(
-                plt.MaxNLocator(
-                    int(
-                        len(loop_dates) / ticks_divisor
-                    )
-                )
-            )
-        plt.xlabel('Date')
-        plt.ylabel('Number')
-
-        title = f"Entire Planet daily COVID-19 status upto {date_string}"
-        logger.info(title)
-        plt.title(title)
-        ax.legend(
-            loc='upper center',
-            bbox_to_anchor=(0.5, -0.05),
-            shadow=True,
-            ncol=3,
-        )
-        # plt.show()
-        logger.info(f"Saving chart for {title} to {save_file_path}")
-        plt.savefig(save_file_path)
-        plt.close()
 
-    if generate_gif:
-        gif_path = get_file_path(
-            path.join('charts', f"Entire-Planet-{date_string}.gif"))
-        if not path.exists(gif_path):
-            imageio.mimsave(
-                gif_path,
-                [imageio.imread(filename) for filename in image_file_paths]
-            )
+def create_world_chart(cube, generate_gif=True, jobs=1, **job_options):
+    chart_cache = load_chart_cache()
+    try:
+        run_chart_jobs(get_world_chart_jobs(
+            cube, chart_cache, generate_gif, **job_options), chart_cache, jobs=jobs)
+    finally:
+        save_chart_cache(chart_cache)
 
 
 if __name__ == "__main__":
-    pathlib.Path(get_file_path('charts')
-                 ).mkdir(parents=True, exist_ok=True)
-    daily_data = get_daily_data()
-    logger.debug(pformat(daily_data.keys()))
-    for country_region, country_report in daily_data.items():
-        create_daily_data_line_chart_for_one_country(
-            country_region, daily_data[country_region])
-    create_world_chart(daily_data)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help="number of processes to render charts with (default: 1)")
+    parser.add_argument(
+        '--animation', choices=list(ANIMATION_WRITER_ARGS) + ['none'], default='gif',
+        help="animation to build for each series (default: gif)")
+    parser.add_argument(
+        '--no-png', dest='write_png', action='store_false',
+        help="only build animations, don't save a png per day")
+    args = parser.parse_args()
+    if args.animation == 'mp4':
+        try:
+            import imageio_ffmpeg  # noqa: F401
+        except ImportError:
+            parser.error("mp4 animations need imageio-ffmpeg installed")
+    job_options = {
+        'generate_gif': args.animation != 'none',
+        'animation_format': args.animation,
+        'write_png': args.write_png,
+    }
+
+    daily_cube = get_daily_cube()
+    logger.info(
+        f"{len(daily_cube['locations'])} locations over {len(daily_cube['dates'])} days")
+    chart_cache = load_chart_cache()
+    chart_jobs = []
+    for country_region in daily_cube['countries']:
+        chart_jobs += get_country_chart_jobs(
+            daily_cube, country_region, chart_cache, **job_options)
+    chart_jobs += get_world_chart_jobs(daily_cube, chart_cache, **job_options)
+    try:
+        run_chart_jobs(chart_jobs, chart_cache, args.jobs)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted, charts rendered so far are kept")
+        sys.exit(130)
+    finally:
+        save_chart_cache(chart_cache)
+
+    stale_extensions = set()
+    if args.write_png:
+        stale_extensions.add('png')
+    if job_options['generate_gif']:
+        stale_extensions.add(args.animation)
+    collect_chart_garbage(chart_cache, stale_extensions)
+    save_chart_cache(chart_cache)
@@ -1,74 +1,202 @@
-import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib import request, parse, error as urlError
-from os import environ, path
+from os import environ, getpid, path, replace
+import argparse
+import datetime
+import json
 import pathlib
 import logging
+import sys
+import threading
+
+sys.path.insert(0, path.join(pathlib.Path(__file__).parents[1].absolute(), 'dist', 'data'))
+from profiling import stage  # noqa: E402
 
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=environ.get('LOG_LEVEL', 'INFO'))
 logger = logging.getLogger("Data Retrieval")
 
+CSSE_BASE_URL = environ.get(
+    'CSSE_BASE_URL', "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/")
+# Remembers ETag/Last-Modified per file so unchanged files aren't downloaded again
+FETCH_MANIFEST = '.fetch_manifest.json'
+FETCH_JOBS = 8
+FETCH_TIMEOUT = 60
+
 
 def get_file_path(file_name):
     return path.join(pathlib.Path(__file__).parents[0].absolute(), file_name)
 
 
-def get_data_from_url(url, url_root):
+def get_data_from_url(url, url_root, headers=None):
     full_url = parse.urljoin(url_root, url)
     logger.info(f"Getting data from {full_url}")
-    response = request.urlopen(full_url)
-    data = response.read()
-    text = data.decode('utf-8').replace("\r", "")
-    return text
+    response = request.urlopen(
+        request.Request(full_url, headers=headers or {}), timeout=FETCH_TIMEOUT)
+    with response:
+        data = response.read()
+        text = data.decode('utf-8').replace("\r", "")
+        return text, response.headers
 
 
 def write_file_to_disk(data, file_name, pathed_filename=False):
     file_path = file_name if pathed_filename else get_file_path(file_name)
-    with open(file_path, 'w', encoding="utf-8") as f:
+    # Write then rename so an interrupted download never leaves half a file
+    temp_file_path = f"{file_path}.{getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file_path, 'w', encoding="utf-8") as f:
         f.write(data)
+    replace(temp_file_path, file_path)
+
+
+def load_fetch_manifest():
+    try:
+        with open(get_file_path(FETCH_MANIFEST), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_fetch_manifest(manifest):
+    write_file_to_disk(json.dumps(manifest, indent=2,
+                                  sort_keys=True), FETCH_MANIFEST)
+
+
+def fetch_file(url, url_root, file_name, manifest_entry=None):
+    """Downloads url to file_name, conditionally if it was downloaded before.
+
+    Returns (status, manifest_entry) where status is 'downloaded',
+    'not modified' or 'missing' (404, e.g. today's report isn't out yet).
+    """
+    headers = {}
+    if manifest_entry and path.exists(get_file_path(file_name)):
+        if manifest_entry.get('etag'):
+            headers['If-None-Match'] = manifest_entry['etag']
+        if manifest_entry.get('last_modified'):
+            headers['If-Modified-Since'] = manifest_entry['last_modified']
+    try:
+        text, response_headers = get_data_from_url(url, url_root, headers)
+    except urlError.HTTPError as e:
+        if e.code == 304:
+            return 'not modified', manifest_entry
+        if e.code == 404:
+            return 'missing', manifest_entry
+        raise
+    write_file_to_disk(text, file_name)
+    return 'downloaded', {
+        'url': parse.urljoin(url_root, url),
+        'etag': response_headers.get('ETag'),
+        'last_modified': response_headers.get('Last-Modified'),
+        'retrieved': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+    }
+
+
+def fetch_files(files, url_root, jobs=FETCH_JOBS, record_missing=False):
+    """Fetches [(url, file_name), ...] concurrently, recording each in the manifest.
+
+    The manifest is saved even if the run is interrupted, and failed files are
+    simply tried again next run. With record_missing, 404s are recorded too,
+    for files that will never be published.
+    """
+    manifest = load_fetch_manifest()
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(fetch_file, url, url_root, file_name, manifest.get(file_name)): file_name
+            for url, file_name in files
+        }
+        try:
+            for future in as_completed(futures):
+                file_name = futures[future]
+                try:
+                    status, manifest_entry = future.result()
+                except (urlError.URLError, OSError) as e:
+                    logger.warning(f"Failed to get {file_name}: {e}")
+                    results[file_name] = 'failed'
+                    continue
+                results[file_name] = status
+                if status == 'missing' and record_missing:
+                    manifest_entry = {
+                        'missing': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+                    }
+                if manifest_entry:
+                    manifest[file_name] = manifest_entry
+                logger.info(f"{file_name}: {status}")
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            save_fetch_manifest(manifest)
+    return results
+
+
+def get_daily_report(date):
+    """(url, file_name) of the CSSE daily report for date"""
+    formatted_date = date.strftime("%m-%d-%Y")
+    return (f"csse_covid_19_data/csse_covid_19_daily_reports/{formatted_date}.csv",
+            f"csse_daily_{formatted_date}.csv")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--jobs', type=int, default=FETCH_JOBS,
+        help=f"number of concurrent downloads (default: {FETCH_JOBS})")
+    parser.add_argument(
+        '--base-url', default=CSSE_BASE_URL,
+        help="where to get the CSSE repository files from")
+    args = parser.parse_args()
+
     # CSSE COVID-19 Data
     # csse_covid_19_daily_reports
     start_date = datetime.date(2020, 1, 22)
     current_date = datetime.date.today()
-    url = "csse_covid_19_data/csse_covid_19_daily_reports/01-22-2020.csv"
     # csse_covid_19_time_series
-    time_series_confirmed_url = "csse_covid_19_data/csse_covid_19_time_series/time_series_19-covid-Deaths.csv"
-    time_series_deaths_url = "csse_covid_19_data/csse_covid_19_time_series/time_series_19-covid-Confirmed.csv"
+    time_series_confirmed_url = "csse_covid_19_data/csse_covid_19_time_series/time_series_19-covid-Confirmed.csv"
+    time_series_deaths_url = "csse_covid_19_data/csse_covid_19_time_series/time_series_19-covid-Deaths.csv"
     time_series_recovered_url = "csse_covid_19_data/csse_covid_19_time_series/time_series_19-covid-Recovered.csv"
     # who_covid_19_sit_rep_time_series
     who_set_rep_url = "who_covid_19_situation_reports/who_covid_19_sit_rep_time_series/who_covid_19_sit_rep_time_series.csv"
 
-    csse_covid19_base_url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/"
-    write_file_to_disk(get_data_from_url(time_series_confirmed_url, csse_covid19_base_url),
-                       'covid_confirmed.csv')
-    write_file_to_disk(get_data_from_url(time_series_deaths_url, csse_covid19_base_url),
-                       'covid_deaths.csv')
-    write_file_to_disk(get_data_from_url(time_series_recovered_url, csse_covid19_base_url),
-                       'covid_recovered.csv')
-    write_file_to_disk(get_data_from_url(who_set_rep_url, csse_covid19_base_url),
-                       'who_sit_rep.csv')
-
-    target_date = start_date
-    while target_date <= current_date:
-        formatted_target_date = target_date.strftime("%m-%d-%Y")
-        target_url = f"csse_covid_19_data/csse_covid_19_daily_reports/{formatted_target_date}.csv"
-
-        file_path = get_file_path(f"csse_daily_{formatted_target_date}.csv")
-        if not path.exists(file_path):
-            try:
-                file_data = get_data_from_url(
-                    target_url, csse_covid19_base_url)
-            except urlError.HTTPError:
-                break
-            write_file_to_disk(file_data, file_path, True)
+    # These are overwritten upstream, so they're checked every run
+    files = [
+        (time_series_confirmed_url, 'covid_confirmed.csv'),
+        (time_series_deaths_url, 'covid_deaths.csv'),
+        (time_series_recovered_url, 'covid_recovered.csv'),
+        (who_set_rep_url, 'who_sit_rep.csv'),
+    ]
 
-        target_date += datetime.timedelta(days=1)
+    # Daily reports don't change once published, so only missing ones are
+    # fetched: any gaps before the newest one on disk, then the days after it
+    daily_reports = [get_daily_report(start_date + datetime.timedelta(days=day))
+                     for day in range((current_date - start_date).days + 1)]
+    newest = max([i for i, (_, file_name) in enumerate(daily_reports)
+                  if path.exists(get_file_path(file_name))], default=-1)
+    # A gap upstream has already published past won't be filled, so its 404
+    # is recorded and not asked for again
+    fetch_manifest = load_fetch_manifest()
+    gaps = [daily_report for daily_report in daily_reports[:max(newest, 0)]
+            if not path.exists(get_file_path(daily_report[1])) and
+            'missing' not in fetch_manifest.get(daily_report[1], {})]
+
+    with stage('retrieve_data.fetch_files', jobs=args.jobs) as metrics:
+        results = fetch_files(files, args.base_url, args.jobs)
+        results.update(fetch_files(gaps, args.base_url, args.jobs, record_missing=True))
+        # New reports are fetched a batch at a time, stopping at a 404 with no
+        # later report after it, so a stale upstream costs one batch per run
+        for start in range(newest + 1, len(daily_reports), args.jobs):
+            batch = daily_reports[start:start + args.jobs]
+            batch_results = fetch_files(batch, args.base_url, args.jobs)
+            results.update(batch_results)
+            if batch_results[batch[-1][1]] != 'downloaded':
+                break
+        metrics['rows'] = len(results)
+        for status in ['downloaded', 'not modified', 'missing', 'failed']:
+            metrics[status] = len(
+                [result for result in results.values() if result == status])
 
     # GeoJSON boundary points for countries
     # geojson_datasets_base_url = "https://raw.githubusercontent.com/datasets/geo-countries/master/"
     # country_boundary_points_url = "data/countries.geojson"
 
-    # write_file_to_disk(get_data_from_url(country_boundary_points_url, geojson_datasets_base_url),
-    #                    'country_boundary_points.geojson')
+    # fetch_files([(country_boundary_points_url, 'country_boundary_points.geojson')],
+    #             geojson_datasets_base_url)
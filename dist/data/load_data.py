@@ -1,19 +1,214 @@
+from array import array
+from contextlib import contextmanager
 from csv import DictReader
 from datetime import datetime, timedelta
 from enum import Enum
+from functools import lru_cache
 from glob import glob
+from itertools import islice
 from math import inf as Infinity
-from os import path
+from os import environ, getpid, path
+import atexit
+import hashlib
 import json
 import logging
 import math
 import pathlib
 import random
 import sqlite3
+import sys
+import threading
 
-logging.basicConfig(level=logging.DEBUG)
+try:
+    from data.profiling import stage, timed
+except ImportError:  # Run as a script from dist/data
+    from profiling import stage, timed
+
+# DEBUG logs every SQL statement, so it slows big loads down noticeably
+logging.basicConfig(level=environ.get('LOG_LEVEL', 'INFO'))
 logger = logging.getLogger("Data Loader")
 
+DB_NAME = environ.get('DB_NAME', 'geography')
+# Where the downloaded CSSE files and other level=2 data live, see get_file_path
+COVID_DATA_DIR = environ.get('COVID_DATA_DIR')
+
+# Connections are kept open in a pool shared by every thread of the process.
+# Each outermost transaction() takes one out and puts it back when it ends, so
+# a threaded server reuses the same few connections for every request.
+# Set SQLITE_POOLING=0 to go back to connect-per-call.
+SQLITE_POOLING = environ.get('SQLITE_POOLING', '1') != '0'
+# Most connections open at once per database; more threads wait for one
+SQLITE_POOL_SIZE = int(environ.get('SQLITE_POOL_SIZE', '8'))
+SQLITE_CACHED_STATEMENTS = 256
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -20000",  # ~20MB
+    "PRAGMA mmap_size = 268435456",  # 256MB
+]
+
+_connection_pool = {'pid': None}
+_connection_pool_lock = threading.Lock()
+# The connection each thread has checked out, and how deeply nested its transactions are
+_checkouts = threading.local()
+
+# Tables are created if missing, so a fresh geography database can be loaded
+SCHEMA = {
+    'country': [
+        """CREATE TABLE IF NOT EXISTS country (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            iso TEXT,
+            affiliation TEXT,
+            area INTEGER,
+            perimeter INTEGER,
+            population INTEGER,
+            land_area INTEGER,
+            water_area INTEGER,
+            center_lat REAL,
+            center_lng REAL,
+            global_region TEXT
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS country_key ON country (name)",
+    ],
+    'division_primary': [
+        """CREATE TABLE IF NOT EXISTS division_primary (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            country INTEGER
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS division_primary_key ON division_primary (name)",
+    ],
+    'boundary_point': [
+        """CREATE TABLE IF NOT EXISTS boundary_point (
+            id INTEGER PRIMARY KEY,
+            lat REAL,
+            lng REAL,
+            area_name TEXT,
+            area_iso TEXT,
+            area_type TEXT,
+            division INTEGER
+        )""",
+    ],
+    'covid_confirmed': [
+        """CREATE TABLE IF NOT EXISTS covid_confirmed (
+            id INTEGER PRIMARY KEY,
+            division_primary INTEGER,
+            division_secondary INTEGER,
+            country INTEGER,
+            date TEXT,  -- ISO 8601, YYYY-MM-DD
+            count INTEGER
+        )""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS covid_confirmed_key ON covid_confirmed (
+            country, IFNULL(division_primary, -1), IFNULL(division_secondary, -1), date
+        )""",
+        "CREATE INDEX IF NOT EXISTS covid_confirmed_country_date ON covid_confirmed (country, date)",
+        "CREATE INDEX IF NOT EXISTS covid_confirmed_division_primary_date ON covid_confirmed (division_primary, date)",
+    ],
+    # Rollups of covid_confirmed kept up to date by update_case_rollups()
+    'covid_confirmed_country_daily': [
+        """CREATE TABLE IF NOT EXISTS covid_confirmed_country_daily (
+            country INTEGER,
+            date TEXT,
+            count INTEGER,
+            new_count INTEGER,
+            new_count_avg_7d REAL,
+            PRIMARY KEY (country, date)
+        )""",
+    ],
+    'covid_confirmed_world_daily': [
+        """CREATE TABLE IF NOT EXISTS covid_confirmed_world_daily (
+            date TEXT PRIMARY KEY,
+            count INTEGER,
+            new_count INTEGER,
+            new_count_avg_7d REAL
+        )""",
+    ],
+    # Bumped by every transaction that writes, see transaction()
+    'load_generation': [
+        "CREATE TABLE IF NOT EXISTS load_generation (generation INTEGER)",
+        "INSERT INTO load_generation (generation) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM load_generation)",
+    ],
+    'load_state': [
+        """CREATE TABLE IF NOT EXISTS load_state (
+            source TEXT,
+            item TEXT,
+            digest TEXT,
+            loaded_at TEXT,
+            PRIMARY KEY (source, item)
+        )""",
+    ],
+    'boundary_polygon': [
+        """CREATE TABLE IF NOT EXISTS boundary_polygon (
+            id INTEGER PRIMARY KEY,
+            area_name TEXT,
+            area_iso TEXT,
+            area_type TEXT,
+            division INTEGER,
+            zoom INTEGER,
+            point_count INTEGER,
+            points BLOB,
+            points_json TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS boundary_polygon_zoom ON boundary_polygon (zoom, area_iso, division)",
+    ],
+}
+
+# Natural key of each table, used by the 'upsert' and 'update' actions.
+# Must match a unique index in SCHEMA.
+TABLE_KEYS = {
+    'country': ['name'],
+    'division_primary': ['name'],
+    'covid_confirmed': ['country', 'division_primary', 'division_secondary', 'date'],
+    'covid_confirmed_country_daily': ['country', 'date'],
+    'covid_confirmed_world_daily': ['date'],
+    'load_state': ['source', 'item'],
+}
+# NULLs never conflict in a unique index, so these key columns are indexed
+# and matched as IFNULL(column, -1)
+NULLABLE_KEYS = {
+    'covid_confirmed': ['division_primary', 'division_secondary'],
+}
+
+# Run once per database, in order, tracked with PRAGMA user_version.
+# Each entry is a list of (table_name, statement); missing tables are skipped.
+MIGRATIONS = [
+    # Before keyed upserts every load inserted all of covid_confirmed again;
+    # keep the newest copy of each cell so covid_confirmed_key can be created
+    [('covid_confirmed', """DELETE FROM covid_confirmed WHERE id NOT IN (
+        SELECT MAX(id) FROM covid_confirmed GROUP BY
+            country, IFNULL(division_primary, -1), IFNULL(division_secondary, -1), date
+    )""")],
+    # covid_confirmed.date was the CSSE m/d/yy column name, which can't be
+    # range scanned or sorted; the digests are dropped so the next load
+    # rewrites every cell with ISO dates
+    [('covid_confirmed', """UPDATE covid_confirmed SET date = printf('20%02d-%02d-%02d',
+        CAST(substr(date, instr(substr(date, instr(date, '/') + 1), '/') + instr(date, '/') + 1) AS INTEGER),
+        CAST(date AS INTEGER),
+        CAST(substr(date, instr(date, '/') + 1) AS INTEGER)
+    ) WHERE date LIKE '%/%/%'"""),
+     ('load_state', "DELETE FROM load_state WHERE source = 'covid_confirmed.csv'")],
+    # The rollup tables are filled from the cells each load writes, so the
+    # next load has to write them all
+    [('load_state', "DELETE FROM load_state WHERE source = 'covid_confirmed.csv'")],
+]
+
+# Expressions that turn covid_confirmed.date into the start of its bucket;
+# weeks start on Monday
+CASE_BUCKETS = {
+    'day': "date",
+    'week': "date(date, 'weekday 0', '-6 days')",
+}
+
+# boundary_polygon keeps a simplified copy of each polygon for every one of
+# these map zoom levels; the last level holds the full detail polygons
+BOUNDARY_ZOOM_LEVELS = [0, 2, 4, 6, 8, 10]
+
+# Rows per executemany when streaming large files into the database
+INSERT_BATCH_SIZE = 10000
+GEOJSON_READ_SIZE = 1 << 16
+
 
 class data_processes(Enum):
     def TEXT(string): return string if string else None
@@ -24,12 +219,13 @@ class data_processes(Enum):
 
 def get_file_path(file_name, level=1):
     # level=1 will give COVID-19/dist/data
-    # level=2 will give COVID-19/data
-    base_path = pathlib.Path(__file__).parents[level].absolute()
-    logger.debug(base_path)
-    logger.debug(file_name)
-    file_path = path.join(base_path, 'data', file_name)
-    logger.info(f"path for {file_name}: {file_path}")
+    # level=2 will give COVID-19/data, or COVID_DATA_DIR if it's set
+    if level == 2 and COVID_DATA_DIR:
+        file_path = path.join(COVID_DATA_DIR, file_name)
+    else:
+        base_path = pathlib.Path(__file__).parents[level].absolute()
+        file_path = path.join(base_path, 'data', file_name)
+    logger.debug(f"path for {file_name}: {file_path}")
     return file_path
 
 
@@ -83,7 +279,6 @@ def load_geojson_datafile(file_name, data_mapping, area_type='country', path_lev
     data = []
     for feature in raw_data:
         for boundary_point in feature['boundary_points']:
-            logger.debug(boundary_point)
             data_row = {
                 'area_name': feature['area_name'],
                 'area_iso': feature['area_iso'],
@@ -98,36 +293,416 @@ def load_geojson_datafile(file_name, data_mapping, area_type='country', path_lev
     return data
 
 
-def process_sql(db_path, sql_string="", sql_data=[], fetch_results=False):
-    logger.info("Processing SQL data")
+def _get_connection_pool():
+    # sqlite3 connections can't be carried across a fork
+    pid = getpid()
+    with _connection_pool_lock:
+        if _connection_pool['pid'] != pid:
+            _connection_pool.update(pid=pid, idle={}, slots={})
+    return _connection_pool
+
+
+def _get_checkouts():
+    if getattr(_checkouts, 'pid', None) != getpid():
+        _checkouts.pid = getpid()
+        _checkouts.connections = {}
+        _checkouts.depths = {}
+    return _checkouts
+
+
+def open_connection(db_path):
+    logger.info(f"Opening connection to {db_path}")
+    # isolation_level=None hands transaction control to transaction();
+    # cached_statements keeps compiled statements for reuse by SQL string.
+    # Pooled connections move between threads, but only one uses each at a time.
+    connection = sqlite3.connect(
+        db_path,
+        isolation_level=None,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+        check_same_thread=False,
+    )
+    if SQLITE_POOLING:
+        for pragma in SQLITE_PRAGMAS:
+            connection.execute(pragma)
+    return connection
+
+
+def check_out_connection(db_path):
+    """(connection, pool slot) for db_path, waiting while the pool is all in use."""
+    if not SQLITE_POOLING:
+        return open_connection(db_path), None
+    pool = _get_connection_pool()
+    with _connection_pool_lock:
+        slots = pool['slots'].setdefault(db_path, threading.BoundedSemaphore(SQLITE_POOL_SIZE))
+    slots.acquire()
+    try:
+        with _connection_pool_lock:
+            idle = pool['idle'].setdefault(db_path, [])
+            connection = idle.pop() if idle else None
+        return connection or open_connection(db_path), slots
+    except BaseException:
+        slots.release()
+        raise
+
+
+def check_in_connection(db_path, connection, slots):
+    if slots is None:
+        connection.close()
+        return
+    try:
+        if connection.in_transaction:
+            # A failed COMMIT leaves the transaction open
+            connection.execute("ROLLBACK")
+        pool = _get_connection_pool()
+        with _connection_pool_lock:
+            if pool['slots'].get(db_path) is slots:
+                pool['idle'].setdefault(db_path, []).append(connection)
+                connection = None
+        if connection is not None:
+            # The pool was closed while this one was out
+            connection.close()
+    finally:
+        slots.release()
+
+
+def close_connections():
+    """Closes every idle pooled connection, whichever thread opened it."""
+    pool = _get_connection_pool()
+    with _connection_pool_lock:
+        connections = [connection for idle in pool['idle'].values() for connection in idle]
+        pool['idle'] = {}
+        pool['slots'] = {}
+    for connection in connections:
+        connection.close()
+
+
+atexit.register(close_connections)
+
+
+@lru_cache(maxsize=None)
+def get_database_path(db_name):
+    return get_file_path(f"{db_name}.sqlite3")
+
+
+@contextmanager
+def transaction(db_name=DB_NAME, db_path=None):
+    """Everything run against db_name inside this block commits once at the end.
+
+    Nested blocks join the outermost one, which checks a connection out of
+    the pool and returns it afterwards. A commit that changed any rows
+    also bumps load_generation, which readers use to tell their caches of
+    the database are stale.
+    """
+    if db_path is None:
+        db_path = get_database_path(db_name)
+    checkouts = _get_checkouts()
+    depth = checkouts.depths.get(db_path, 0)
+    if depth == 0:
+        checkouts.connections[db_path] = check_out_connection(db_path)
+    connection, _ = checkouts.connections[db_path]
+    checkouts.depths[db_path] = depth + 1
+    try:
+        if depth == 0:
+            connection.execute("BEGIN")
+            total_changes = connection.total_changes
+        try:
+            yield connection
+        except BaseException:
+            if depth == 0:
+                connection.execute("ROLLBACK")
+            raise
+        else:
+            if depth == 0:
+                if connection.total_changes != total_changes:
+                    bump_load_generation(connection)
+                connection.execute("COMMIT")
+    finally:
+        checkouts.depths[db_path] = depth
+        if depth == 0:
+            check_in_connection(db_path, *checkouts.connections.pop(db_path))
+
+
+def bump_load_generation(connection):
+    try:
+        connection.execute(
+            "UPDATE load_generation SET generation = generation + 1;")
+    except sqlite3.OperationalError:
+        pass  # Databases that predate load_generation have nothing to bump
+
+
+def get_load_generation(db_name=DB_NAME):
+    try:
+        rows = process_sql(get_database_path(db_name),
+                           "SELECT generation FROM load_generation;", None, True)
+    except sqlite3.OperationalError:
+        return 0
+    return rows[0][0] if rows else 0
+
+
+def iter_geojson_features(file_path, read_size=GEOJSON_READ_SIZE):
+    """Yields the features of a FeatureCollection one at a time.
+
+    Only the feature being decoded is held in memory, so this works on files
+    far larger than json.loads could handle.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        position = -1
+        while position < 0:
+            chunk = f.read(read_size)
+            if not chunk:
+                raise ValueError(f"No features found in {file_path}")
+            buffer += chunk
+            position = buffer.find('"features"')
+            if position < 0:
+                buffer = buffer[-len('"features"'):]
+        buffer = buffer[position + len('"features"'):]
+
+        at_end_of_file = False
+        expected = [':', '[']
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                if at_end_of_file:
+                    raise ValueError(f"Unterminated features in {file_path}")
+                chunk = f.read(read_size)
+                at_end_of_file = not chunk
+                buffer += chunk
+                continue
+            if expected:
+                if buffer[0] != expected.pop(0):
+                    raise ValueError(f"Malformed features in {file_path}")
+                buffer = buffer[1:]
+                continue
+            if buffer[0] == ']':
+                return
+            if buffer[0] == ',':
+                buffer = buffer[1:]
+                continue
+            try:
+                feature, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if at_end_of_file:
+                    raise
+                # Grow the read so very large features decode in few attempts
+                chunk = f.read(max(read_size, len(buffer)))
+                at_end_of_file = not chunk
+                buffer += chunk
+                continue
+            buffer = buffer[end:]
+            yield feature
+
+
+def iter_geojson_rows(file_name, data_mapping, area_type='country', path_level=1):
+    file_path = get_file_path(file_name, path_level)
+    for feature in iter_geojson_features(file_path):
+        processed_data = process_data_with_mapping(
+            feature['properties'], data_mapping)
+        geometry = feature['geometry']
+        polygons = geometry['coordinates']
+        if geometry['type'] == 'Polygon':
+            polygons = [polygons]
+        for division, polygon in enumerate(polygons):
+            for ring in polygon:
+                for lng, lat, *_ in ring:
+                    yield {
+                        'area_name': processed_data['area_name'],
+                        'area_iso': processed_data['area_iso'],
+                        'area_type': area_type,
+                        'lat': lat,
+                        'lng': lng,
+                        'division': division,
+                    }
+
+
+def migrate_database(connection):
+    version = connection.execute("PRAGMA user_version;").fetchone()[0]
+    existing_tables = {name for name, in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table';")}
+    for version, statements in enumerate(MIGRATIONS[version:], version + 1):
+        logger.info(f"Migrating database to version {version}")
+        for table_name, statement in statements:
+            if table_name in existing_tables:
+                connection.execute(statement)
+        connection.execute(f"PRAGMA user_version = {version};")
+
+
+def create_tables(db_name=DB_NAME, table_names=None):
+    with transaction(db_name) as connection:
+        migrate_database(connection)
+        for table_name, statements in SCHEMA.items():
+            if table_names is None or table_name in table_names:
+                for statement in statements:
+                    connection.execute(statement)
+
+
+def pack_points(points):
+    # Always little-endian so the blobs can be served to clients as-is
+    if sys.byteorder == 'big':
+        points = array('d', points)
+        points.byteswap()
+    return points.tobytes()
+
+
+def unpack_points(blob):
+    points = array('d')
+    points.frombytes(blob)
+    if sys.byteorder == 'big':
+        points.byteswap()
+    return points
+
+
+def get_points_json(points):
+    """[[lat, lng], ...] as JSON, the way /api/boundaries serves each polygon"""
+    coordinates = iter(points)
+    return json.dumps(list(zip(coordinates, coordinates)))
+
+
+def get_zoom_tolerance(zoom):
+    # About one pixel of a 256px web map tile, in degrees
+    return 360 / (256 * 2 ** zoom)
+
+
+def get_boundary_zoom_level(zoom=None):
+    """Picks the stored boundary_polygon zoom level to serve for a map zoom."""
+    if zoom is None:
+        return BOUNDARY_ZOOM_LEVELS[-1]
+    levels = [level for level in BOUNDARY_ZOOM_LEVELS if level <= zoom]
+    return levels[-1] if levels else BOUNDARY_ZOOM_LEVELS[0]
+
+
+def simplify_points(points, tolerance):
+    """Douglas-Peucker simplification of a flat lat/lng array."""
+    point_count = len(points) // 2
+    if point_count < 3:
+        return array('d', points)
+    keep = bytearray(point_count)
+    keep[0] = keep[-1] = 1
+    tolerance_squared = tolerance * tolerance
+    stack = [(0, point_count - 1)]
+    while stack:
+        start, end = stack.pop()
+        start_lat, start_lng = points[2 * start], points[2 * start + 1]
+        d_lat = points[2 * end] - start_lat
+        d_lng = points[2 * end + 1] - start_lng
+        length_squared = d_lat * d_lat + d_lng * d_lng
+        max_distance, max_index = 0, None
+        for i in range(start + 1, end):
+            p_lat = points[2 * i] - start_lat
+            p_lng = points[2 * i + 1] - start_lng
+            if length_squared:
+                # Closed rings start and end on the same point
+                cross = p_lat * d_lng - p_lng * d_lat
+                distance = cross * cross / length_squared
+            else:
+                distance = p_lat * p_lat + p_lng * p_lng
+            if distance > max_distance:
+                max_distance, max_index = distance, i
+        if max_distance > tolerance_squared:
+            keep[max_index] = 1
+            stack.append((start, max_index))
+            stack.append((max_index, end))
+    simplified = array('d')
+    for i in range(point_count):
+        if keep[i]:
+            simplified.append(points[2 * i])
+            simplified.append(points[2 * i + 1])
+    return simplified
+
+
+@timed('load_data.build_boundary_polygons')
+def build_boundary_polygons(db_name=DB_NAME):
+    """Packs boundary_point rows into one lat/lng float array per area division.
+
+    Points are grouped the same way /api/boundaries always grouped them, by
+    (division, area_iso, area_name) in id order. Each polygon is stored once
+    per BOUNDARY_ZOOM_LEVELS entry, simplified for that zoom; each level is
+    simplified from the next more detailed one. Every copy keeps its points
+    both packed and as JSON, so neither response format touches each point.
+    """
+    polygons = {}
+    with transaction(db_name) as connection:
+        # Derived data, so it's cheaper to rebuild than to migrate
+        connection.execute("DROP TABLE IF EXISTS boundary_polygon;")
+        create_tables(db_name, ['boundary_polygon'])
+        cursor = connection.execute(
+            "SELECT area_name, area_iso, area_type, division, lat, lng FROM boundary_point ORDER BY id;")
+        for area_name, area_iso, area_type, division, lat, lng in cursor:
+            key = (division, area_iso, area_name)
+            polygon = polygons.get(key)
+            if polygon is None:
+                polygon = polygons[key] = {
+                    'area_name': area_name,
+                    'area_iso': area_iso,
+                    'area_type': area_type,
+                    'division': division,
+                    'points': array('d'),
+                }
+            polygon['points'].append(lat)
+            polygon['points'].append(lng)
+
+        for zoom in reversed(BOUNDARY_ZOOM_LEVELS):
+            sql_data = []
+            for polygon in polygons.values():
+                if zoom != BOUNDARY_ZOOM_LEVELS[-1]:
+                    polygon['points'] = simplify_points(
+                        polygon['points'], get_zoom_tolerance(zoom))
+                point_count = len(polygon['points']) // 2
+                if point_count < 4 and zoom != BOUNDARY_ZOOM_LEVELS[-1]:
+                    continue  # Too small to see at this zoom
+                sql_data.append({
+                    **polygon,
+                    'zoom': zoom,
+                    'point_count': point_count,
+                    'points': pack_points(polygon['points']),
+                    'points_json': get_points_json(polygon['points']),
+                })
+            # Every polygon can be too small for a low zoom, and an empty insert fails
+            if sql_data:
+                database('insert', db_name, 'boundary_polygon', sql_data,
+                         ['area_name', 'area_iso', 'area_type', 'division', 'zoom', 'point_count', 'points', 'points_json'])
+            logger.info(
+                f"Built {len(sql_data)} boundary polygons for zoom {zoom}, {sum(row['point_count'] for row in sql_data)} points")
+    return len(polygons)
+
+
+def ensure_boundary_polygons(db_name=DB_NAME):
+    """Builds boundary_polygon for databases whose boundary points were loaded before it existed.
+
+    Does nothing without boundary points, or if the polygons are already built.
+    """
+    with transaction(db_name) as connection:
+        tables = {name for name, in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table';")}
+        if 'boundary_point' not in tables or connection.execute(
+                "SELECT 1 FROM boundary_point LIMIT 1;").fetchone() is None:
+            return 0
+        if 'boundary_polygon' in tables:
+            columns = {column[1] for column in connection.execute(
+                "PRAGMA table_info(boundary_polygon);")}
+            if 'points_json' in columns and connection.execute(
+                    "SELECT 1 FROM boundary_polygon LIMIT 1;").fetchone() is not None:
+                return 0
+    logger.info(f"Building the boundary polygons missing from {db_name}")
+    return build_boundary_polygons(db_name)
+
+
+def process_sql(db_path, sql_string="", sql_data=None, fetch_results=False):
     logger.debug(sql_string)
-    for datum in sql_data:
-        for index, item in enumerate(datum):
-            if ((index == 0 or index == 1) and item is not None) or\
-                    ((index == 2 or index == 4) and not isinstance(item, int)) or\
-                    ((index == 3) and not isinstance(item, str)):
-                logger.info(datum)
-                logger.info(type(item))
-                logger.info(repr(item))
     data = None
-    with sqlite3.connect(db_path) as connection:
-        cursor = connection.cursor()
-
-        if not isinstance(sql_data, list) or len(sql_data) == 1:
-
-            logger.debug("Processing as one datum")
-            cursor.execute(sql_string, sql_data)
-        elif len(sql_data) > 0:
+    with transaction(db_path=db_path) as connection:
+        if not sql_data:
+            logger.debug("Processing with no data")
+            cursor = connection.execute(sql_string)
+        elif isinstance(sql_data[0], (list, tuple)):
             logger.debug("Processing as data")
-            cursor.executemany(sql_string, sql_data)
+            cursor = connection.executemany(sql_string, sql_data)
         else:
-            logger.debug("Processing with no data")
-            cursor.execute(sql_string)
+            logger.debug("Processing as one datum")
+            cursor = connection.execute(sql_string, sql_data)
         if fetch_results:
             data = cursor.fetchall()
-        logger.debug(cursor)
-        # logger.debug(data)
-        connection.commit()
     return data
 
 
@@ -141,17 +716,63 @@ def insert_data_into_database(db_path, table_name, field_names, sql_data):
     process_sql(db_path, sql_string, sql_data)
 
 
-def update_database_row(db_path, table_name, field_names, sql_data):
-    sql_string = f"UPDATE OR IGNORE {table_name} SET ("
+def get_table_key(table_name, field_names):
+    if table_name not in TABLE_KEYS:
+        raise KeyError(f"No key declared for {table_name} in TABLE_KEYS")
+    key_names = TABLE_KEYS[table_name]
+    missing = [key_name for key_name in key_names if key_name not in field_names]
+    if missing:
+        raise KeyError(f"{table_name} rows need their key fields: {missing}")
+    return key_names
+
+
+def get_key_expression(table_name, key_name, value=None):
+    value = key_name if value is None else value
+    if key_name in NULLABLE_KEYS.get(table_name, []):
+        return f"IFNULL({value}, -1)"
+    return value
+
+
+def upsert_data_into_database(db_path, table_name, field_names, sql_data):
+    key_names = get_table_key(table_name, field_names)
+    sql_string = f"INSERT INTO {table_name} ("
     sql_string += ", ".join(field_names)
-    sql_string += ") = ("
+    sql_string += ") VALUES ("
     sql_string += ", ".join(["?" for x in range(len(field_names))])
-    sql_string += ")"
+    sql_string += ") ON CONFLICT ("
+    sql_string += ", ".join([get_key_expression(table_name, key_name)
+                             for key_name in key_names])
+    sql_string += ") DO "
+    value_names = [field_name for field_name in field_names
+                   if field_name not in key_names]
+    if value_names:
+        sql_string += "UPDATE SET "
+        sql_string += ", ".join([f"{field_name} = excluded.{field_name}"
+                                 for field_name in value_names])
+    else:
+        sql_string += "NOTHING"
     sql_string += ";"
-    logger.debug(sql_string)
     process_sql(db_path, sql_string, sql_data)
 
 
+def update_database_row(db_path, table_name, field_names, sql_data):
+    key_names = get_table_key(table_name, field_names)
+    value_names = [field_name for field_name in field_names
+                   if field_name not in key_names]
+    sql_string = f"UPDATE {table_name} SET "
+    sql_string += ", ".join([f"{field_name} = ?" for field_name in value_names])
+    sql_string += " WHERE "
+    sql_string += " AND ".join([
+        f"{get_key_expression(table_name, key_name)} = {get_key_expression(table_name, key_name, '?')}"
+        for key_name in key_names])
+    sql_string += ";"
+    logger.debug(sql_string)
+    positions = [field_names.index(field_name)
+                 for field_name in value_names + key_names]
+    process_sql(db_path, sql_string, [[datum[position] for position in positions]
+                                      for datum in sql_data])
+
+
 def select_from_database(db_path, table_name, field_names):
     sql_string = "SELECT "
     sql_string += ", ".join(field_names)
@@ -161,7 +782,7 @@ def select_from_database(db_path, table_name, field_names):
 
 
 def select_one_from_database(db_path, table_name, field_names, where_field_names, where_data):
-    logger.info(where_field_names)
+    logger.debug(where_field_names)
     sql_string = (" ").join([
         "SELECT",
         ", ".join(field_names),
@@ -171,7 +792,7 @@ def select_one_from_database(db_path, table_name, field_names, where_field_names
         sql_string = " ".join([
             sql_string,
             "WHERE",
-            "AND".join(
+            " AND ".join(
                 [f"{field_name} = ?" for field_name in where_field_names])
         ])
     sql_string += ";"
@@ -179,11 +800,110 @@ def select_one_from_database(db_path, table_name, field_names, where_field_names
     return process_sql(db_path, sql_string, where_data, True)
 
 
+def select_case_counts(db_name=DB_NAME, country=None, region=None, start=None, end=None, bucket='day'):
+    """Confirmed counts per country, or per region when one is given, per bucket.
+
+    country matches a name or ISO code, region a division_primary name and
+    start/end are inclusive ISO dates. Counts are cumulative, so a bucket
+    holds each location's count on its last day in that bucket.
+    """
+    where = []
+    where_data = []
+    if country is not None:
+        where.append(
+            "country IN (SELECT id FROM country WHERE name = ? COLLATE NOCASE OR iso = ? COLLATE NOCASE)")
+        where_data += [country, country]
+    if region is not None:
+        where.append(
+            "division_primary IN (SELECT id FROM division_primary WHERE name = ? COLLATE NOCASE)")
+        where_data.append(region)
+    if start is not None:
+        where.append("date >= ?")
+        where_data.append(start)
+    if end is not None:
+        where.append("date <= ?")
+        where_data.append(end)
+    # Country totals come straight from the daily rollup; regions need the cells
+    table_name = 'covid_confirmed_country_daily'
+    location_fields = "country"
+    region_name = "NULL"
+    group_by = ["cases.bucket", "cases.country"]
+    if region is not None:
+        table_name = 'covid_confirmed'
+        location_fields = "country, division_primary, division_secondary"
+        region_name = "division_primary.name"
+        group_by.append("cases.division_primary")
+
+    sql_string = " ".join([
+        f"SELECT cases.bucket, country.name, country.iso, {region_name}, SUM(cases.count) FROM (",
+        f"SELECT {location_fields}, {CASE_BUCKETS[bucket]} AS bucket, count, MAX(date)",
+        f"FROM {table_name}",
+        "WHERE " + " AND ".join(where) if where else "",
+        f"GROUP BY {location_fields}, bucket",
+        ") AS cases",
+        "JOIN country ON country.id = cases.country",
+        "LEFT JOIN division_primary ON division_primary.id = cases.division_primary" if region is not None else "",
+        "GROUP BY " + ", ".join(group_by),
+        f"ORDER BY country.name, {region_name}, cases.bucket;",
+    ])
+    return process_sql(get_database_path(db_name), sql_string, where_data, True)
+
+
+def select_daily_totals(db_name=DB_NAME, country=None, start=None, end=None):
+    """count, new_count and new_count_avg_7d per day for one country, or the world.
+
+    country matches a name or ISO code (names win) and start/end are
+    inclusive ISO dates.
+    """
+    table_name = 'covid_confirmed_world_daily'
+    where = []
+    where_data = []
+    if country is not None:
+        table_name = 'covid_confirmed_country_daily'
+        where.append(" ".join([
+            "country = (SELECT id FROM country",
+            "WHERE name = ? COLLATE NOCASE OR iso = ? COLLATE NOCASE",
+            "ORDER BY name = ? COLLATE NOCASE DESC LIMIT 1)",
+        ]))
+        where_data += [country, country, country]
+    if start is not None:
+        where.append("date >= ?")
+        where_data.append(start)
+    if end is not None:
+        where.append("date <= ?")
+        where_data.append(end)
+    sql_string = " ".join([
+        "SELECT date, count, new_count, new_count_avg_7d",
+        f"FROM {table_name}",
+        "WHERE " + " AND ".join(where) if where else "",
+        "ORDER BY date;",
+    ])
+    return process_sql(get_database_path(db_name), sql_string, where_data, True)
+
+
+def insert_batches(db_name, table_name, field_names, data, batch_size=INSERT_BATCH_SIZE):
+    """Inserts an iterable of row dicts in fixed size batches, in one transaction."""
+    row_count = 0
+    data = iter(data)
+    db_path = get_database_path(db_name)
+    with transaction(db_name):
+        while True:
+            sql_data = [[datum[field_name] for field_name in field_names]
+                        for datum in islice(data, batch_size)]
+            if not sql_data:
+                break
+            insert_data_into_database(
+                db_path, table_name, field_names, sql_data)
+            row_count += len(sql_data)
+            logger.info(f"Inserted {row_count} rows into {table_name}")
+    return row_count
+
+
 def database(action, db_name, table_name, data=None, field_names=[], where_field_names=[], where_data=[]):
     if data is not None:
         sql_data = [[datum[field_name]
                      for field_name in field_names] for datum in data]
-    db_path = get_file_path(f"{db_name}.sqlite3")
+    db_path = get_database_path(db_name)
     if action == 'insert':
         insert_data_into_database(
             db_path, table_name, field_names, sql_data)
@@ -191,9 +911,7 @@ def database(action, db_name, table_name, data=None, field_names=[], where_field
         update_database_row(
             db_path, table_name, field_names, sql_data)
     elif action == 'upsert':
-        insert_data_into_database(
-            db_path, table_name, field_names, sql_data)
-        update_database_row(
+        upsert_data_into_database(
             db_path, table_name, field_names, sql_data)
     elif action == 'select':
         return select_from_database(db_path, table_name, field_names)
@@ -203,23 +921,38 @@ def database(action, db_name, table_name, data=None, field_names=[], where_field
         raise KeyError('Invalid database action')
 
 
-def process_datafile(file_name, data_mapping, db_name='geography', table_name="boundary_point", db_action='insert', field_names=None, area_type='country', path_level=2):
+def process_datafile(file_name, data_mapping, db_name=DB_NAME, table_name="boundary_point", db_action='insert', field_names=None, area_type='country', path_level=2, stream=False):
+    with stage('load_data.process_datafile', file=file_name, table=table_name, action=db_action) as metrics:
+        metrics['rows'] = _process_datafile(
+            file_name, data_mapping, db_name, table_name, db_action, field_names, area_type, path_level, stream)
+        return metrics['rows']
+
+
+def _process_datafile(file_name, data_mapping, db_name, table_name, db_action, field_names, area_type, path_level, stream):
     data = []
     data_file_type = file_name.split('.')[-1]
     logger.info(f"Processing {file_name} as {data_file_type}")
+    if field_names is None:
+        field_names = [map['field_name']
+                       for map in data_mapping.values() if map is not None]
+    if stream and data_file_type == "geojson" and db_action == 'insert':
+        # Constant memory: rows go from the file to the database in batches
+        return insert_batches(
+            db_name, table_name, field_names,
+            iter_geojson_rows(file_name, data_mapping, area_type, path_level))
     if data_file_type == "csv":
         data = load_csv_datafile(file_name, data_mapping, path_level)
     elif data_file_type == "geojson":
         data = load_geojson_datafile(
             file_name, data_mapping, area_type, path_level)
     # insert_data_into_database(db_name, table_name, data, data_mapping)
-    if field_names is None:
-        field_names = [map['field_name']
-                       for map in data_mapping.values() if map is not None]
-    database(db_action, db_name, table_name, data, field_names)
+    with transaction(db_name):
+        database(db_action, db_name, table_name, data, field_names)
+    return len(data)
 
 
-def load_country_data():
+def load_country_data(db_name=DB_NAME):
+    create_tables(db_name, ['country', 'load_generation'])
     base_country_data_mapping = {
         'FID': None,
         'COUNTRY': {
@@ -245,6 +978,7 @@ def load_country_data():
         },
     }
     process_datafile(
+        db_name=db_name,
         file_name='UIA_World_Countries_Boundaries.csv',
         data_mapping=base_country_data_mapping,
         path_level=1,
@@ -263,6 +997,7 @@ def load_country_data():
         },
     }
     process_datafile(
+        db_name=db_name,
         file_name='wikipedia_populations.csv',
         data_mapping=country_population_data_mapping,
         path_level=1,
@@ -290,6 +1025,7 @@ def load_country_data():
         'water_pct': None,
     }
     process_datafile(
+        db_name=db_name,
         file_name='wikipedia_areas.csv',
         data_mapping=country_area_data_mapping,
         path_level=1,
@@ -316,6 +1052,7 @@ def load_country_data():
         },
     }
     process_datafile(
+        db_name=db_name,
         file_name='google_dataset_publishing_language_center_lat_lng.csv',
         data_mapping=country_center_data_mapping,
         path_level=1,
@@ -324,7 +1061,8 @@ def load_country_data():
     )
 
 
-def load_boundary_points():
+def load_boundary_points(db_name=DB_NAME):
+    create_tables(db_name, ['boundary_point', 'load_generation'])
     country_boundary_data_mapping = {
 
         'ADMIN': {
@@ -340,24 +1078,89 @@ def load_boundary_points():
         'ISO_A3': None
     }
     process_datafile(
+        db_name=db_name,
         file_name='country_boundary_points.geojson',
         data_mapping=country_boundary_data_mapping,
         db_action='insert',  # Do not upsert/update this cause it's >500k rows
         area_type='country',
+        stream=True,
         field_names=['area_name', 'area_iso',
                      'area_type', 'lat', 'lng', 'division']
     )
+    build_boundary_polygons(db_name)
+
+
+def normalize_name(name):
+    return name.strip(' *').casefold() if name else ''
+
+
+def load_country_aliases(path_level=1):
+    # CSSE country names that differ from the country table's
+    aliases = {}
+    with open(get_file_path('country_aliases.csv', path_level), 'r', encoding='utf-8') as f:
+        for row in DictReader(f):
+            aliases[normalize_name(row['alias'])] = row['name']
+    return aliases
+
+
+def load_geography_index(db_name=DB_NAME):
+    """Loads country and division_primary ids once, keyed by normalized name.
+
+    Countries are also keyed by ISO code; names win over codes on collision.
+    """
+    countries = {}
+    country_rows = database('select', db_name, 'country',
+                            field_names=['id', 'name', 'iso'])
+    if not country_rows:
+        logger.warning(
+            f"No countries in {db_name}, so no case rows will load; run load_country_data() first")
+    for country_id, name, _ in country_rows:
+        if name:
+            countries.setdefault(normalize_name(name), country_id)
+    for country_id, _, iso in country_rows:
+        if iso:
+            countries.setdefault(normalize_name(iso), country_id)
+
+    divisions_primary = {}
+    division_rows = database('select', db_name, 'division_primary',
+                             field_names=['id', 'name'])
+    if not division_rows:
+        logger.warning(
+            f"No primary divisions in {db_name}, so Province/State rows are summed into their country's")
+    for division_id, name in division_rows:
+        if name:
+            divisions_primary.setdefault(normalize_name(name), division_id)
+
+    return {
+        'aliases': load_country_aliases(),
+        'country': countries,
+        'division_primary': divisions_primary,
+    }
+
+
+def resolve_country_id(geography_index, name):
+    # An exact name or ISO code always wins over an alias
+    key = normalize_name(name)
+    country_id = geography_index['country'].get(key)
+    if country_id is None and key in geography_index['aliases']:
+        country_id = geography_index['country'].get(
+            normalize_name(geography_index['aliases'][key]))
+    return country_id
+
+
+def resolve_division_primary_id(geography_index, name):
+    return geography_index['division_primary'].get(normalize_name(name))
 
 
 def get_csse_date_range():
     min_year, min_month, min_day = Infinity, Infinity, Infinity
     max_year, max_month, max_day = -Infinity, -Infinity, -Infinity
 
-    daily_files = glob("data/csse_daily_*.csv")
+    daily_files = glob(get_file_path("csse_daily_*.csv", 2))
     # random.shuffle(daily_files) # For testing
     for file_path in daily_files:
-        month, day, year = [int(x) for x in file_path.split(
-            "\\")[-1].split('_')[-1].split('.')[0].split('-')]
+        month, day, year = [int(x) for x in path.basename(
+            file_path).split('_')[-1].split('.')[0].split('-')]
         logger.debug(f"{month}, {day}, {year}")
         if year < min_year:
             min_year = year
@@ -391,7 +1194,17 @@ def get_csse_date_range():
     return (start_date, end_date)
 
 
-def load_csse_daily_covid_data():
+def load_csse_daily_covid_data(full_reload=False, db_name=DB_NAME):
+    """Loads covid_confirmed.csv, writing only the cells that changed.
+
+    load_state keeps a digest of every location row and every date column
+    from the last load. A cell is written when both its row and its date
+    changed, so a new day only touches that day's cells. full_reload=True
+    ignores the stored digests.
+    """
+    create_tables(db_name, ['country', 'division_primary', 'covid_confirmed',
+                            'covid_confirmed_country_daily', 'covid_confirmed_world_daily',
+                            'load_generation', 'load_state'])
     confirmed_data_mapping = {
         'Province/State': {
             'field_name': 'division_primary_data',
@@ -408,21 +1221,47 @@ def load_csse_daily_covid_data():
     }
 
     start_date, end_date = get_csse_date_range()
+    dates = []
     target_date = start_date
     while target_date <= end_date:
-        target_date_text = '{d.month}/{d.day}/{d:%y}'.format(d=target_date)
+        target_date_text = get_csse_date_text(target_date)
         confirmed_data_mapping[target_date_text] = {
             'field_name': target_date_text,
             'process': data_processes.INT
         }
+        dates.append(target_date.date())
         target_date += timedelta(days=1)
-    logger.info(confirmed_data_mapping)
+    logger.debug(confirmed_data_mapping)
 
-    file_data = load_csv_datafile(
-        'covid_confirmed.csv', confirmed_data_mapping, path_level=2)
-    sql_data = []
+    with stage('load_data.load_csv_datafile', file='covid_confirmed.csv') as metrics:
+        file_data = load_csv_datafile(
+            'covid_confirmed.csv', confirmed_data_mapping, path_level=2)
+        metrics['rows'] = len(file_data)
+    with stage('load_data.load_csse_daily_covid_rows') as metrics, transaction(db_name):
+        metrics['rows'] = _load_csse_daily_covid_rows(
+            file_data, dates, full_reload, db_name=db_name)
+
+
+def get_csse_date_text(date):
+    # The CSSE time series name their date columns m/d/yy
+    return '{d.month}/{d.day}/{d:%y}'.format(d=date)
+
+
+def add_counts(a, b):
+    if a is None and b is None:
+        return None
+    return (a or 0) + (b or 0)
+
+
+def get_digest(value):
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()
+
+
+def _load_csse_daily_covid_rows(file_data, dates, full_reload=False, source='covid_confirmed.csv', db_name=DB_NAME):
+    geography_index = load_geography_index(db_name)
+    date_texts = [get_csse_date_text(date) for date in dates]
+    location_counts = {}
     for data_row in file_data:
-        logger.debug(data_row)
         country_name = data_row['country_data']
         division_primary_id = None
         # TODO: Some of the country_data are actually country.iso and the primary data is a country name.  gotta clean up the country imports.
@@ -430,42 +1269,128 @@ def load_csse_daily_covid_data():
         if country_name is None:
             continue
 
-        logger.error(country_name)
-        country_id = database('select_one', 'geography', 'country', None, [
-                              'id'], where_field_names=['name'], where_data=[country_name])
-        if country_id is not None and len(country_id) == 1:
-            country_id = country_id[0][0]
-        else:
-            logger.warning(
-                f"Looked up {country_name}, but got back {country_id}")
-        logger.info(f"Country: {country_id} {country_name}")
+        country_id = resolve_country_id(geography_index, country_name)
+        if country_id is None:
+            logger.warning(f"Looked up {country_name}, but got back nothing")
+        logger.debug(f"Country: {country_id} {country_name}")
 
         if data_row['division_primary_data'] is not None:
-            division_primary_name = data_row['division_primary_data']
-            division_primary_id = database('select_one', 'geography', 'division_primary', None, [
-                'id'], where_field_names=['name'], where_data=[division_primary_name])
-            if division_primary_id is not None and len(division_primary_id) == 1:
-                division_primary_id = division_primary_id[0][0]
-            else:
-                division_primary_id = None
+            division_primary_id = resolve_division_primary_id(
+                geography_index, data_row['division_primary_data'])
 
-        logger.info(country_id)
         if isinstance(country_id, int):
-            target_date = start_date
-            while target_date <= end_date:
-                target_date_text = '{d.month}/{d.day}/{d:%y}'.format(
-                    d=target_date)
+            key = (country_id, division_primary_id, division_secondary_id)
+            counts = [data_row[date_text] for date_text in date_texts]
+            if key in location_counts:
+                # Provinces without a division_primary of their own share the
+                # country's key, so they're summed into it
+                counts = [add_counts(a, b) for a, b in zip(location_counts[key], counts)]
+            location_counts[key] = counts
+
+    # Digest every location row and every date column; NULL ids sort first
+    locations = sorted(location_counts, key=lambda key: tuple(
+        -1 if value is None else value for value in key))
+    digests = {}
+    for key in locations:
+        digests["row:{}:{}:{}".format(*key)] = get_digest(location_counts[key])
+    for i, date in enumerate(dates):
+        digests[f"date:{date.isoformat()}"] = get_digest(
+            [(key, location_counts[key][i]) for key in locations])
+
+    loaded_digests = {} if full_reload else dict(database(
+        'select_one', db_name, 'load_state', None, ['item', 'digest'],
+        where_field_names=['source'], where_data=[source]))
+    changed_items = {item for item, digest in digests.items()
+                     if loaded_digests.get(item) != digest}
+    changed_dates = [(i, date.isoformat()) for i, date in enumerate(dates)
+                     if f"date:{date.isoformat()}" in changed_items]
+
+    sql_data = []
+    if changed_dates:
+        for key in locations:
+            if "row:{}:{}:{}".format(*key) not in changed_items:
+                continue
+            country_id, division_primary_id, division_secondary_id = key
+            for i, date in changed_dates:
                 sql_data.append({
                     'division_primary': division_primary_id,
                     'division_secondary': division_secondary_id,
                     'country': country_id,
-                    'date': target_date_text,
-                    'count': data_row[target_date_text]
+                    'date': date,
+                    'count': location_counts[key][i],
                 })
-                target_date += timedelta(days=1)
+    logger.info(
+        f"{len(sql_data)} of {len(locations) * len(dates)} covid_confirmed cells changed since the last load")
     if len(sql_data) > 0:
-        database('insert', 'geography', 'covid_confirmed', data=sql_data,
+        database('upsert', db_name, 'covid_confirmed', data=sql_data,
                  field_names=['division_primary', 'division_secondary', 'country', 'date', 'count'])
+        changed_since = {}
+        for datum in sql_data:
+            country_id = datum['country']
+            changed_since[country_id] = min(
+                datum['date'], changed_since.get(country_id, datum['date']))
+        update_case_rollups(db_name, changed_since)
+    if len(changed_items) > 0:
+        loaded_at = datetime.utcnow().isoformat(timespec='seconds')
+        database('upsert', db_name, 'load_state', data=[{
+            'source': source,
+            'item': item,
+            'digest': digests[item],
+            'loaded_at': loaded_at,
+        } for item in sorted(changed_items)], field_names=['source', 'item', 'digest', 'loaded_at'])
+    return len(sql_data)
+
+
+@timed('load_data.update_case_rollups')
+def update_case_rollups(db_name, changed_since):
+    """Rebuilds the daily rollups from the first changed date onwards.
+
+    changed_since is {country id: earliest ISO date written}. Each day's
+    new_count is its count minus the day before's, and new_count_avg_7d
+    averages new_count over that day and the 6 before it, so a week of
+    history before the first changed date is read back for context.
+    """
+    db_path = get_database_path(db_name)
+    process_sql(db_path, """INSERT INTO covid_confirmed_country_daily (
+            country, date, count, new_count, new_count_avg_7d
+        ) SELECT country, date, count, new_count, new_count_avg_7d FROM (
+            SELECT country, date, count, new_count,
+                AVG(new_count) OVER (ORDER BY date ROWS 6 PRECEDING) AS new_count_avg_7d
+            FROM (
+                SELECT country, date, count, count - LAG(count, 1, 0) OVER (ORDER BY date) AS new_count
+                FROM (
+                    SELECT ? AS country, date, SUM(count) AS count FROM covid_confirmed
+                    WHERE country = ? AND date >= date(?, '-7 days') GROUP BY date
+                )
+            )
+        ) WHERE date >= ?
+        ON CONFLICT (country, date) DO UPDATE SET
+            count = excluded.count,
+            new_count = excluded.new_count,
+            new_count_avg_7d = excluded.new_count_avg_7d;""",
+                [[country_id, country_id, date, date] for country_id, date in changed_since.items()])
+
+    world_since = min(changed_since.values())
+    process_sql(db_path, """INSERT INTO covid_confirmed_world_daily (
+            date, count, new_count, new_count_avg_7d
+        ) SELECT date, count, new_count, new_count_avg_7d FROM (
+            SELECT date, count, new_count,
+                AVG(new_count) OVER (ORDER BY date ROWS 6 PRECEDING) AS new_count_avg_7d
+            FROM (
+                SELECT date, count, count - LAG(count, 1, 0) OVER (ORDER BY date) AS new_count
+                FROM (
+                    SELECT date, SUM(count) AS count FROM covid_confirmed_country_daily
+                    WHERE date >= date(?, '-7 days') GROUP BY date
+                )
+            )
+        ) WHERE date >= ?
+        ON CONFLICT (date) DO UPDATE SET
+            count = excluded.count,
+            new_count = excluded.new_count,
+            new_count_avg_7d = excluded.new_count_avg_7d;""",
+                [world_since, world_since])
+    logger.info(
+        f"Updated case rollups for {len(changed_since)} countries, world since {world_since}")
 
 
 def load_csse_accumulated_totals_data():
@@ -479,6 +1404,7 @@ def load_who_sit_rep():
 if __name__ == "__main__":
     # load_country_data()
     # load_boundary_points()
+    ensure_boundary_polygons()
     load_csse_daily_covid_data()
     load_csse_accumulated_totals_data()
     load_who_sit_rep()
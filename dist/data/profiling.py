@@ -0,0 +1,106 @@
+"""Per-stage timings, throughput and memory for the data pipeline and server
+
+Every stage logs one JSON line to the "Pipeline Metrics" logger, e.g.
+{"stage": "load_data.process_datafile", "seconds": 1.2, "rows": 250000,
+ "rows_per_sec": 208333.3, "peak_rss_mb": 61.4, ...}
+
+METRICS_FILE=path also appends each line to that file.
+PROFILE_DIR=path runs the outermost stage under cProfile and dumps the
+latest run of each stage to PROFILE_DIR/<stage>.<pid>.prof.
+"""
+from contextlib import contextmanager
+from os import environ, getpid, makedirs, path
+import cProfile
+import functools
+import json
+import logging
+import re
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not on Windows, so no peak memory there
+
+logger = logging.getLogger("Pipeline Metrics")
+
+_profiling = threading.local()
+
+
+def get_peak_rss_mb():
+    """Peak resident memory of this process so far, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+def emit(metrics):
+    line = json.dumps(metrics, default=str)
+    logger.info(line)
+    metrics_file = environ.get('METRICS_FILE')
+    if metrics_file:
+        with open(metrics_file, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def start_profiler():
+    profile_dir = environ.get('PROFILE_DIR')
+    # Only one profiler can run at a time, so nested stages are part of their parent's
+    if not profile_dir or getattr(_profiling, 'active', False):
+        return None
+    _profiling.active = True
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler, name):
+    profiler.disable()
+    _profiling.active = False
+    profile_dir = environ['PROFILE_DIR']
+    makedirs(profile_dir, exist_ok=True)
+    file_name = re.sub(r'[^\w.-]+', '_', name).strip('_')
+    profiler.dump_stats(path.join(profile_dir, f"{file_name}.{getpid()}.prof"))
+
+
+@contextmanager
+def stage(name, **fields):
+    """Times the block and emits its metrics when it ends.
+
+    Yields the metrics dict, so the block can add to it; a 'rows' count
+    also gets a rows_per_sec.
+    """
+    metrics = {'stage': name, **fields}
+    profiler = start_profiler()
+    start = time.perf_counter()
+    try:
+        yield metrics
+    except BaseException as e:
+        metrics['error'] = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler is not None:
+            stop_profiler(profiler, name)
+        metrics['seconds'] = round(elapsed, 6)
+        if metrics.get('rows') is not None and elapsed > 0:
+            metrics['rows_per_sec'] = round(metrics['rows'] / elapsed, 1)
+        metrics['peak_rss_mb'] = get_peak_rss_mb()
+        emit(metrics)
+
+
+def timed(name=None):
+    """Decorator that runs each call of a function as a stage."""
+    def decorator(function):
+        stage_name = name or f"{function.__module__}.{function.__name__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
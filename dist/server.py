@@ -1,14 +1,121 @@
-from data.load_data import database
+from data.load_data import CASE_BUCKETS, database, get_boundary_zoom_level, get_load_generation, get_points_json, pack_points, select_case_counts, select_daily_totals
+from data.profiling import stage
+from array import array
+from collections import OrderedDict
+import datetime
+import functools
+import gzip
+import hashlib
 import os
 import json
-from flask import Flask, render_template
+import sqlite3
+import struct
+import threading
+from flask import Flask, Response, render_template, request
 import logging
 
-logging.basicConfig(level=logging.INFO)
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Only gzip is offered
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
 logger = logging.getLogger("Flask Server")
 
 
 app = Flask(__name__)
+DB_NAME = os.environ.get('DB_NAME', 'geography')
+
+# /api/* responses are kept in memory until the database's load generation
+# changes. Set RESPONSE_CACHE=0 to build every response from the database.
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', '1') != '0'
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_MAX_AGE = 300
+COMPRESS_MIN_SIZE = 1024
+
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def timed_route(view):
+    """Emits each request's timing, status and size as a stage."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with stage(f"server.{view.__name__}", path=request.full_path) as metrics:
+            response = app.make_response(view(*args, **kwargs))
+            metrics['status'] = response.status_code
+            metrics['bytes'] = response.content_length
+            return response
+    return wrapper
+
+
+def cached_response(view):
+    """Serves view's responses from memory until the database next changes.
+
+    Each payload is built and compressed once per load generation, least
+    recently used payloads are dropped past RESPONSE_CACHE_SIZE, and every
+    response has an ETag so clients can revalidate with If-None-Match.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not RESPONSE_CACHE:
+            return view(*args, **kwargs)
+        generation = get_load_generation(DB_NAME)
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        with _response_cache_lock:
+            entry = _response_cache.get(key)
+            if entry is not None and entry['generation'] == generation:
+                _response_cache.move_to_end(key)
+            else:
+                entry = None
+        if entry is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = get_cache_entry(response, generation)
+            with _response_cache_lock:
+                _response_cache[key] = entry
+                _response_cache.move_to_end(key)
+                while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                    _response_cache.popitem(last=False)
+        return get_cached_response(entry)
+    return wrapper
+
+
+def get_cache_entry(response, generation):
+    body = response.get_data()
+    bodies = {'identity': body}
+    if len(body) >= COMPRESS_MIN_SIZE:
+        bodies['gzip'] = gzip.compress(body, compresslevel=6)
+        if brotli is not None:
+            bodies['br'] = brotli.compress(body, quality=6)
+    return {
+        'generation': generation,
+        'etag': hashlib.sha1(body).hexdigest(),
+        'mimetype': response.mimetype,
+        'bodies': bodies,
+    }
+
+
+def get_cached_response(entry):
+    encoding = 'identity'
+    for accepted in ['br', 'gzip']:
+        if accepted in entry['bodies'] and request.accept_encodings[accepted]:
+            encoding = accepted
+            break
+    # Each encoding is a different set of bytes, so each needs its own strong ETag
+    etag = entry['etag'] if encoding == 'identity' else f"{entry['etag']}-{encoding}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(
+            entry['bodies'][encoding], mimetype=entry['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={RESPONSE_MAX_AGE}"
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route("/")
@@ -18,11 +125,13 @@ def index():
 
 
 @app.route("/api/countries")
+@timed_route
+@cached_response
 def all_countries_data():
     logger.info('retreiving country data')
     field_names = ['name', 'population', 'area', 'center_lat',
                    'center_lng', 'iso', 'global_region', 'land_area', 'water_area']
-    sql_data = database('select', 'geography', 'country',
+    sql_data = database('select', DB_NAME, 'country',
                         data=[], field_names=field_names)
     data = []
     for sql_datum in sql_data:
@@ -33,39 +142,174 @@ def all_countries_data():
 
 
 @app.route("/api/boundaries")
+@timed_route
+@cached_response
 def all_boundaries_data():
     logger.info('retreiving boundary data')
-    field_names = ['id', 'lat', 'lng', 'area_name',
-                   'area_iso', 'area_type', 'division']
-    sql_data = database('select', 'geography', 'boundary_point',
-                        data=[], field_names=field_names)
-    raw_data = []
-    for sql_datum in sql_data:
-        raw_data.append({
-            field_names[i]: field_data for (i, field_data) in enumerate(sql_datum)
+    # Without ?zoom=N this serves the full detail boundaries
+    zoom = get_boundary_zoom_level(request.args.get('zoom', type=int))
+    binary = request.args.get('format') == 'binary'
+    try:
+        sql_data = select_boundary_polygons(zoom, 'points' if binary else 'points_json')
+    except sqlite3.OperationalError:
+        # Databases loaded before boundary_polygon (or its points_json) existed
+        logger.warning(
+            "boundary_polygon isn't built, serving full detail boundary_point rows; run dist/data/load_data.py to build it")
+        serialize = pack_points if binary else get_points_json
+        sql_data = [(*row[:-1], serialize(row[-1])) for row in select_boundary_points()]
+    if binary:
+        return binary_boundaries_response(sql_data)
+    # Each polygon's points were serialized when it was built, so they're
+    # spliced in as they are rather than decoded and dumped again
+    polygons = {}
+    for area_name, area_iso, area_type, division, points_json in sql_data:
+        properties = json.dumps({
+            'iso': area_iso,
+            'name': area_name,
+            'type': area_type,
+            'division': division,
         })
-    data = {}
-    for sql_datum in raw_data:
-        try:
-            data[f"{sql_datum['division']}-{sql_datum['area_iso']}-{sql_datum['area_name']}"]['boundaries'].append(
-                (sql_datum['lat'], sql_datum['lng'])
-            )
-        except KeyError:
-            data[f"{sql_datum['division']}-{sql_datum['area_iso']}-{sql_datum['area_name']}"] = {
-                'iso': sql_datum['area_iso'],
-                'name': sql_datum['area_name'],
-                'type': sql_datum['area_type'],
-                'division': sql_datum['division'],
-                'boundaries': [(sql_datum['lat'], sql_datum['lng'])]
-            }
-    logger.info(
-        data[f"{sql_datum['division']}-{sql_datum['area_iso']}-{sql_datum['area_name']}"])
+        polygons[f"{division}-{area_iso}-{area_name}"] = f'{properties[:-1]}, "boundaries": {points_json}}}'
+    logger.info(f"{len(polygons)} boundaries")
+    return "{" + ", ".join(f"{json.dumps(key)}: {polygon}" for key, polygon in polygons.items()) + "}"
+
+
+def select_boundary_polygons(zoom, points_field_name):
+    field_names = ['area_name', 'area_iso', 'area_type', 'division', points_field_name]
+    return database('select_one', DB_NAME, 'boundary_polygon', None, field_names,
+                    where_field_names=['zoom'], where_data=[zoom])
+
+
+def select_boundary_points():
+    """boundary_point rows grouped into polygons, the way build_boundary_polygons groups them"""
+    field_names = ['area_name', 'area_iso', 'area_type', 'division', 'lat', 'lng']
+    polygons = {}
+    for area_name, area_iso, area_type, division, lat, lng in database(
+            'select', DB_NAME, 'boundary_point', field_names=field_names):
+        polygon = polygons.get((division, area_iso, area_name))
+        if polygon is None:
+            polygon = polygons[(division, area_iso, area_name)] = (
+                area_name, area_iso, area_type, division, array('d'))
+        polygon[-1].append(lat)
+        polygon[-1].append(lng)
+    return list(polygons.values())
+
+
+@app.route("/api/cases")
+@timed_route
+@cached_response
+def cases_data():
+    """Confirmed cases, e.g. /api/cases?country=CA&start=2020-03-01&bucket=week
+
+    Filters: country (name or ISO code), region (province/state),
+    start and end (inclusive YYYY-MM-DD). bucket is day (default) or week.
+    """
+    logger.info('retreiving case data')
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in CASE_BUCKETS:
+        return json.dumps({'error': f"bucket must be one of {list(CASE_BUCKETS)}"}), 400
+    error = get_date_range_error()
+    if error is not None:
+        return json.dumps({'error': error}), 400
+    sql_data = select_case_counts(
+        DB_NAME,
+        country=request.args.get('country'),
+        region=request.args.get('region'),
+        start=request.args.get('start'),
+        end=request.args.get('end'),
+        bucket=bucket,
+    )
+    data = []
+    for date, country_name, country_iso, region, count in sql_data:
+        datum = {
+            'date': date,
+            'country': country_name,
+            'iso': country_iso,
+            'count': count,
+        }
+        if region is not None:
+            datum['region'] = region
+        data.append(datum)
+    logger.info(f"{len(data)} case counts")
+    return json.dumps(data)
+
+
+@app.route("/api/totals")
+@timed_route
+@cached_response
+def totals_data():
+    """Daily confirmed cases for the world, or one country with ?country=
+
+    Each day has the cumulative count, new cases since the day before and
+    the 7 day average of new cases. start and end (inclusive YYYY-MM-DD)
+    narrow the range.
+    """
+    logger.info('retreiving daily totals')
+    error = get_date_range_error()
+    if error is not None:
+        return json.dumps({'error': error}), 400
+    sql_data = select_daily_totals(
+        DB_NAME,
+        country=request.args.get('country'),
+        start=request.args.get('start'),
+        end=request.args.get('end'),
+    )
+    data = []
+    for date, count, new_count, new_count_avg_7d in sql_data:
+        data.append({
+            'date': date,
+            'count': count,
+            'new': new_count,
+            'new_avg_7d': new_count_avg_7d,
+        })
+    logger.info(f"{len(data)} daily totals")
     return json.dumps(data)
 
 
+def get_date_range_error():
+    for arg in ['start', 'end']:
+        try:
+            if arg in request.args:
+                datetime.date.fromisoformat(request.args[arg])
+        except ValueError:
+            return f"{arg} must be a YYYY-MM-DD date"
+    return None
+
+
+def binary_boundaries_response(sql_data):
+    """Packed layout for clients that can read typed arrays:
+
+    a little-endian uint32 header length, a JSON header listing each polygon's
+    offset and point count, then every polygon's lat/lng float64 pairs.
+    """
+    header = []
+    offset = 0
+    for area_name, area_iso, area_type, division, points in sql_data:
+        point_count = len(points) // 16
+        header.append({
+            'iso': area_iso,
+            'name': area_name,
+            'type': area_type,
+            'division': division,
+            'offset': offset,
+            'count': point_count,
+        })
+        offset += point_count * 2
+    header_bytes = json.dumps(header).encode('utf-8')
+    # Pad so the float64 data starts on an 8 byte boundary
+    header_bytes += b' ' * (-(len(header_bytes) + 4) % 8)
+    body = b''.join(
+        [struct.pack('<I', len(header_bytes)), header_bytes] +
+        [points for *_, points in sql_data]
+    )
+    return Response(body, mimetype='application/octet-stream')
+
+
 if __name__ == "__main__":
+    # The debugger and reloader are opt in, with FLASK_DEBUG=1
     app.run(
         host=os.environ.get('HOST', '0.0.0.0'),
-        port=os.environ.get('PORT', 3000),
-        debug=os.environ.get('FLASK_DEBUG', True),
+        port=int(os.environ.get('PORT', 3000)),
+        debug=os.environ.get('FLASK_DEBUG') == '1',
+        threaded=True,
     )
@@ -4,12 +4,14 @@ import "./../stylesheets/map.less";
 export default class Map extends React.Component {
   state = {
     map: null,
+    boundaryLayer: null,
     countries: []
   };
 
   initializeMap() {
     const map = L.map("mapid").setView([23.633225, 5.606425], 2);
-    this.setState({ map });
+    const boundaryLayer = L.layerGroup().addTo(map);
+    this.setState({ map, boundaryLayer });
     L.tileLayer("https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png", {
       attribution:
         '&copy; <a href="https://openstreetmap.org/copyright">OpenStreetMap contributors</a>',
@@ -17,89 +19,76 @@ export default class Map extends React.Component {
       minZoom: 0
     }).addTo(map);
 
-    const { countries } = this.state;
+    // The server simplifies boundaries to suit the zoom level
+    map.on("zoomend", () => this.loadBoundaries(map.getZoom()));
+    return this.loadBoundaries(map.getZoom());
+  }
+
+  drawBoundaries(countries) {
+    const { boundaryLayer } = this.state;
+    boundaryLayer.clearLayers();
     countries.forEach(country => {
-      if (
-        country.boundaries &&
-        country.boundaries.length > 0
-        // !country.boundaries.any(
-        //   boundary => boundary[0] === 0 || boundary[1] === 0
-        // ) &&
-        // country.name === "Canada"
-      ) {
+      if (country.boundaries && country.boundaries.length > 0) {
         country.boundaries.forEach(boundary => {
-          // console.log("30", country);
-          // console.log("31", typeof country);
-          // console.log("32", country.name);
-          // console.log("33", country.boundaries);
-          const country_shape = L.polygon(boundary).addTo(map);
+          const country_shape = L.polygon(boundary).addTo(boundaryLayer);
           country_shape.bindPopup(`${country.name}`);
-          // console.log(country_shape);
         });
       }
     });
   }
 
-  getGeographicalData() {
-    console.log("getting geographical data");
-    let countries = [];
+  getCountryData() {
+    console.log("getting country data");
     return fetch("http://localhost:3000/api/countries")
       .then(response => response.json())
-      .then(countryData => {
-        // console.log(countryData);
-        countries = countryData;
-      })
-      .then(() => fetch("http://localhost:3000/api/boundaries"))
+      .then(countries => {
+        this.setState({ countries });
+      });
+  }
+
+  getBoundaryData(zoom) {
+    if (this.boundaryCache[zoom]) {
+      return Promise.resolve(this.boundaryCache[zoom]);
+    }
+    console.log(`getting boundary data for zoom ${zoom}`);
+    const countries = this.state.countries.map(country => ({
+      ...country,
+      boundaries: []
+    }));
+    return fetch(`http://localhost:3000/api/boundaries?zoom=${zoom}`)
       .then(response => response.json())
       .then(boundaryData => {
-        console.log(boundaryData);
         Object.keys(boundaryData).forEach(boundaryId => {
           const boundary = boundaryData[boundaryId];
-          // console.log(boundary);
           const countryIndex = countries.findIndex(
             country =>
               boundary.type === "country" &&
               boundary.name === country.name &&
               boundary.iso === country.iso
           );
-          // console.log(boundary);
-          if (
-            countryIndex !== undefined &&
-            countries[countryIndex] !== undefined
-          ) {
-            if (countries[countryIndex].boundaries) {
-              countries[countryIndex].boundaries.push(boundary.boundaries);
-            } else {
-              countries[countryIndex].boundaries = [boundary.boundaries];
-            }
+          if (countryIndex !== -1) {
+            countries[countryIndex].boundaries.push(boundary.boundaries);
           } else {
-            if (
-              countryIndex !== undefined &&
-              countries[countryIndex] !== undefined &&
-              countries[countryIndex].name !== undefined
-            ) {
-              console.log(
-                `No boundaries for ${countryIndex}:${countries[countryIndex].name}/${boundary.name}`
-              );
-              console.log(countries[countryIndex]);
-              console.log(boundary);
-            } else {
-              console.log(`No boundaries for ${countryIndex}:${boundary.name}`);
-            }
+            console.log(`No country for boundary ${boundary.name}`);
           }
         });
-      })
-      .then(() => {
-        console.log("geographical data gotten", countries);
-        this.setState({
-          countries
-        });
+        this.boundaryCache[zoom] = countries;
+        return countries;
       });
   }
 
+  loadBoundaries(zoom) {
+    return this.getBoundaryData(zoom).then(countries => {
+      if (this.state.map.getZoom() === zoom) {
+        this.drawBoundaries(countries);
+      }
+    });
+  }
+
   componentDidMount() {
     console.log("component mounted");
-    this.getGeographicalData().then(() => {
+    this.boundaryCache = {};
+    this.getCountryData().then(() => {
       console.log("initializing Map");
       this.initializeMap();
     });